@@ -0,0 +1,166 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import collections
+import logging
+from collections.abc import Callable
+from typing import Any, Literal, Protocol
+
+from kaybee_agent import metrics
+
+FEEDBACK_ENTRIES = metrics.Counter(
+    "kaybee_feedback_entries_total",
+    "Feedback entries by outcome (accepted, rejected, dropped, flushed, failed).",
+    labelnames=("outcome",),
+)
+FEEDBACK_FLUSH_SECONDS = metrics.Histogram(
+    "kaybee_feedback_flush_seconds",
+    "Time spent writing one batch of feedback to its sink.",
+)
+
+
+class FeedbackSink(Protocol):
+    """Destination for batches of feedback entries."""
+
+    def write_batch(self, entries: list[dict[str, Any]]) -> None: ...
+
+
+class CloudLoggingSink:
+    """Writes each batch to Cloud Logging in a single API call."""
+
+    def __init__(self, get_logger: Callable[[], Any]) -> None:
+        """
+        :param get_logger: Returns the google.cloud.logging Logger to write to,
+            called on each flush so that the client can be created lazily
+        """
+        self.get_logger = get_logger
+
+    def write_batch(self, entries: list[dict[str, Any]]) -> None:
+        batch = self.get_logger().batch()
+        for entry in entries:
+            batch.log_struct(entry, severity="INFO")
+        batch.commit()
+
+
+class LocalSink:
+    """Keeps flushed entries in memory, for tests and local development."""
+
+    def __init__(self) -> None:
+        self.entries: list[dict[str, Any]] = []
+        self.batches = 0
+
+    def write_batch(self, entries: list[dict[str, Any]]) -> None:
+        self.entries.extend(entries)
+        self.batches += 1
+
+
+class FeedbackBuffer:
+    """
+    A bounded in-memory buffer of feedback entries, flushed to a sink in batches
+    by a background task whenever `batch_size` entries are pending or
+    `flush_interval` seconds have passed, and once more on shutdown.
+
+    When the buffer is full, the "drop_oldest" policy discards the oldest pending
+    entry to make room, while the "reject" policy refuses the new entry so that
+    callers can push back on the client.
+    """
+
+    def __init__(
+        self,
+        sink: FeedbackSink,
+        max_size: int = 1000,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+        overflow: Literal["drop_oldest", "reject"] = "drop_oldest",
+    ) -> None:
+        """
+        :param sink: Where flushed batches are written
+        :param max_size: Maximum number of pending entries
+        :param batch_size: Number of entries written per sink call
+        :param flush_interval: Maximum seconds an entry waits before a flush
+        :param overflow: What to do with a new entry when the buffer is full
+        """
+        self.sink = sink
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self._pending: collections.deque[dict[str, Any]] = collections.deque()
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(self, entry: dict[str, Any]) -> bool:
+        """
+        Queue an entry without blocking.
+
+        :param entry: The structured log entry
+        :return: False if the entry was rejected because the buffer is full
+        """
+        if len(self._pending) >= self.max_size:
+            if self.overflow == "reject":
+                FEEDBACK_ENTRIES.inc(outcome="rejected")
+                return False
+            self._pending.popleft()
+            FEEDBACK_ENTRIES.inc(outcome="dropped")
+
+        self._pending.append(entry)
+        FEEDBACK_ENTRIES.inc(outcome="accepted")
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def start(self) -> None:
+        """Start the background flush task on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the background flush task and flush everything still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write all pending entries to the sink, `batch_size` at a time."""
+        while self._pending:
+            batch = [
+                self._pending.popleft()
+                for _ in range(min(self.batch_size, len(self._pending)))
+            ]
+            try:
+                with FEEDBACK_FLUSH_SECONDS.time():
+                    await asyncio.to_thread(self.sink.write_batch, batch)
+            except Exception:
+                logging.exception("Failed to write %d feedback entries.", len(batch))
+                FEEDBACK_ENTRIES.inc(len(batch), outcome="failed")
+            else:
+                FEEDBACK_ENTRIES.inc(len(batch), outcome="flushed")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
@@ -0,0 +1,199 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+from collections.abc import Iterator
+from typing import TYPE_CHECKING
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+
+if TYPE_CHECKING:
+    from kaybee_agent import graph_index
+
+# Read-only access to tenant knowledge graphs, served from the same storage and
+# in-memory indexes as the agent's tools, without any model calls. Responses
+# carry the graph version as their ETag and honour If-None-Match. The graph
+# modules (and their Storage client and fuzzy matching imports) are imported on
+# first use, so that KAYBEE_FAST_START keeps them off the startup path.
+router = APIRouter(prefix="/graphs", tags=["graphs"])
+
+# Seconds for which reads may be served from the cached latest version without
+# checking storage for a newer one.
+MAX_STALENESS = float(os.getenv("KAYBEE_READ_API_MAX_STALENESS", "1.0"))
+
+
+def _etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def _not_modified(request: Request, version: int) -> bool:
+    """Whether the request's If-None-Match already names this graph version."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or _etag(version) in tags
+
+
+def _get_latest_index(graph_id: str) -> "graph_index.GraphIndex":
+    from kaybee_agent import graph_index
+
+    index = graph_index.get_graph_index(graph_id, stage="read", max_staleness=MAX_STALENESS)
+    # Version 0 means nothing has been stored for this graph.
+    if index.version == 0:
+        raise HTTPException(status_code=404, detail="Unknown graph")
+    return index
+
+
+def _get_index(graph_id: str, request: Request, response: Response) -> "graph_index.GraphIndex":
+    index = _get_latest_index(graph_id)
+    if _not_modified(request, index.version):
+        raise HTTPException(status_code=304, headers={"ETag": _etag(index.version)})
+    response.headers["ETag"] = _etag(index.version)
+    return index
+
+
+@router.get("/{graph_id}/aliases")
+def lookup_alias(
+    graph_id: str,
+    request: Request,
+    response: Response,
+    name: str,
+    fuzzy: bool = False,
+    threshold: int = Query(80, ge=0, le=100),
+) -> dict:
+    """Find entities by one of their names.
+
+    Args:
+        graph_id: The graph (user ID) to search
+        name: The name to look up, ignoring case
+        fuzzy: Also match names within `threshold` of `name`, as the agent does
+        threshold: Minimum fuzzy match score, from 0 to 100
+
+    Returns:
+        The matching entities
+    """
+    index = _get_index(graph_id, request, response)
+    if fuzzy:
+        entity_ids = index.find_entity_ids_by_name(name, threshold=threshold)
+    else:
+        entity_ids = index.lookup_alias(name)
+    return {"entities": [index.g["entities"][entity_id] for entity_id in sorted(entity_ids)]}
+
+
+@router.get("/{graph_id}/entities/{entity_id}")
+def get_entity(graph_id: str, entity_id: str, request: Request, response: Response) -> dict:
+    """Get an entity and its relationships.
+
+    Args:
+        graph_id: The graph (user ID) to read
+        entity_id: The entity to get
+
+    Returns:
+        The entity, and every relationship it is the source or target of
+    """
+    index = _get_index(graph_id, request, response)
+    if entity_id not in index.g["entities"]:
+        raise HTTPException(status_code=404, detail="Unknown entity")
+    return {
+        "entity": index.g["entities"][entity_id],
+        "relationships": index.relationships.get(entity_id, []),
+    }
+
+
+@router.get("/{graph_id}/entities/{entity_id}/neighborhood")
+def get_neighborhood(
+    graph_id: str,
+    entity_id: str,
+    request: Request,
+    response: Response,
+    hops: int = Query(2, ge=0, le=4),
+) -> dict:
+    """Get the subgraph within `hops` relationships of an entity.
+
+    Args:
+        graph_id: The graph (user ID) to read
+        entity_id: The entity at the center of the neighborhood
+        hops: How many relationships away from the entity to go
+
+    Returns:
+        The neighborhood's entities and the relationships among them
+    """
+    index = _get_index(graph_id, request, response)
+    if entity_id not in index.g["entities"]:
+        raise HTTPException(status_code=404, detail="Unknown entity")
+    return index.subgraph(index.expand({entity_id}, hops=hops))
+
+
+def _export_lines(index: "graph_index.GraphIndex", entity_ids: list[str]) -> Iterator[str]:
+    for entity_id in entity_ids:
+        yield json.dumps({"entity": index.g["entities"][entity_id]}) + "\n"
+    for entity_id in entity_ids:
+        for rel in index.relationships.get(entity_id, []):
+            if rel["source_entity_id"] == entity_id:
+                yield json.dumps({"relationship": rel}) + "\n"
+
+
+@router.get("/{graph_id}/export")
+def export_graph(
+    graph_id: str,
+    request: Request,
+    page_size: int = Query(1000, ge=1, le=10000),
+    page_token: str | None = None,
+) -> StreamingResponse:
+    """Stream a page of a graph as newline-delimited JSON.
+
+    Each line is {"entity": ...} or {"relationship": ...}. A page holds up to
+    `page_size` entities, in entity ID order, followed by the relationships
+    they are the source of. While there are more pages, the X-Next-Page-Token
+    header holds the token for the next one. Every page of an export comes from
+    the same graph version; if that version is no longer cached, the export
+    must be restarted (410).
+
+    Args:
+        graph_id: The graph (user ID) to export
+        page_size: Maximum number of entities in the page
+        page_token: The X-Next-Page-Token of the previous page, if any
+
+    Returns:
+        The page, as newline-delimited JSON
+    """
+    from kaybee_agent import graph_index, graph_store
+
+    if page_token:
+        try:
+            version, offset = (int(part) for part in page_token.split(":"))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid page token")
+        g = graph_store.get_cached_graph(graph_id, version)
+        if g is None:
+            raise HTTPException(status_code=410, detail="Graph version no longer available")
+        index = graph_index.index_graph(graph_id, g, version)
+    else:
+        index = _get_latest_index(graph_id)
+        offset = 0
+    if _not_modified(request, index.version):
+        raise HTTPException(status_code=304, headers={"ETag": _etag(index.version)})
+
+    entity_ids = index.sorted_entity_ids[offset:offset + page_size]
+    headers = {"ETag": _etag(index.version)}
+    if offset + page_size < len(index.sorted_entity_ids):
+        headers["X-Next-Page-Token"] = f"{index.version}:{offset + page_size}"
+    return StreamingResponse(
+        _export_lines(index, entity_ids),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
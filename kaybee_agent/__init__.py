@@ -12,6 +12,14 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .agent import root_agent
-
 __all__ = ["root_agent"]
+
+
+def __getattr__(name):
+    # The agent tree pulls in ADK, networkx and thefuzz, so it is only imported
+    # once something (the ADK agent loader or the server warm-up) asks for it.
+    if name == "root_agent":
+        from .agent import root_agent
+
+        return root_agent
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,308 @@
+"""Admission control for model calls.
+
+Every model call made by the agents goes through one AdmissionController per
+process, which
+- limits the calls in flight, per instance and per agent,
+- queues calls that can't start yet fairly across tenants (round robin),
+- paces calls with a token bucket,
+- retries rate-limited calls with jittered exponential backoff, bounded by a
+  retry budget so that retries can't pile up on an overloaded model.
+
+Configuration comes from the environment:
+    KAYBEE_MODEL_MAX_CONCURRENCY    calls in flight per instance (default 32)
+    KAYBEE_MODEL_AGENT_CONCURRENCY  per-agent limits, e.g. "merge_knowledge_agent=8,knowledge_base_agent=16"
+    KAYBEE_MODEL_RATE               calls started per second, 0 for no limit (default 0)
+    KAYBEE_MODEL_BURST              token bucket size (default: the rate)
+    KAYBEE_MODEL_MAX_RETRIES        retries per call (default 3)
+    KAYBEE_MODEL_RETRY_RATIO        retries allowed per call, across all calls (default 0.2)
+"""
+
+import asyncio
+import collections
+import contextvars
+import itertools
+import os
+import random
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from typing import Optional, TypeVar
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import Gemini, LlmRequest, LlmResponse
+from google.genai import types
+
+from kaybee_agent import metrics
+
+T = TypeVar("T")
+
+# Marks the end of a stream's items.
+_DONE = object()
+
+# The tenant (user ID) on whose behalf model calls in this context are made.
+current_tenant: contextvars.ContextVar[str] = contextvars.ContextVar("kaybee_tenant", default="")
+
+QUEUE_WAIT_SECONDS = metrics.Histogram(
+    "kaybee_model_queue_wait_seconds",
+    "Time a model call waited for admission, including rate limiting.",
+    labelnames=("agent",),
+)
+MODEL_CALL_ATTEMPTS = metrics.Counter(
+    "kaybee_model_call_attempts_total",
+    "Model call attempts by outcome (ok, retried, error, retry_budget_exhausted).",
+    labelnames=("agent", "outcome"),
+)
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """Whether an exception from a model call means the call was rate limited."""
+    return getattr(e, "code", None) == 429 or getattr(e, "status", None) == "RESOURCE_EXHAUSTED"
+
+
+class TokenBucket:
+    """Paces events to `rate` per second, allowing bursts of up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RetryBudget:
+    """
+    Allows retries in proportion to first attempts: each call deposits `ratio`
+    of a retry, and each retry withdraws one. `min_per_second` retries are
+    always allowed, so that low traffic can still retry; the budget starts
+    with ten seconds' worth of them.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, max_balance: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_balance = max_balance
+        self._balance = min(max_balance, 10 * min_per_second)
+        self._updated = time.monotonic()
+
+    def _refill(self, amount: float) -> None:
+        now = time.monotonic()
+        self._balance = min(
+            self.max_balance,
+            self._balance + amount + (now - self._updated) * self.min_per_second,
+        )
+        self._updated = now
+
+    def deposit(self) -> None:
+        self._refill(self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill(0.0)
+        if self._balance < 1:
+            return False
+        self._balance -= 1
+        return True
+
+
+class AdmissionController:
+    """Limits, queues, paces and retries model calls. See the module docstring."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        agent_concurrency: Optional[dict[str, int]] = None,
+        rate: float = 0.0,
+        burst: Optional[float] = None,
+        max_retries: int = 3,
+        retry_budget: Optional[RetryBudget] = None,
+        base_backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        is_retryable: Callable[[Exception], bool] = is_rate_limit_error,
+    ):
+        self.max_concurrency = max_concurrency
+        self.agent_concurrency = agent_concurrency or {}
+        self.bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self.max_retries = max_retries
+        self.retry_budget = retry_budget or RetryBudget()
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.is_retryable = is_retryable
+
+        self.in_flight = 0
+        self.agent_in_flight: collections.Counter[str] = collections.Counter()
+        # Waiting calls as (agent, future), per tenant, in round robin order.
+        self._waiting: collections.OrderedDict[str, collections.deque] = collections.OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        agent_concurrency = {}
+        for item in os.environ.get("KAYBEE_MODEL_AGENT_CONCURRENCY", "").split(","):
+            if item.strip():
+                agent, limit = item.split("=")
+                agent_concurrency[agent.strip()] = int(limit)
+        burst = os.environ.get("KAYBEE_MODEL_BURST")
+        return cls(
+            max_concurrency=int(os.environ.get("KAYBEE_MODEL_MAX_CONCURRENCY", "32")),
+            agent_concurrency=agent_concurrency,
+            rate=float(os.environ.get("KAYBEE_MODEL_RATE", "0")),
+            burst=float(burst) if burst else None,
+            max_retries=int(os.environ.get("KAYBEE_MODEL_MAX_RETRIES", "3")),
+            retry_budget=RetryBudget(ratio=float(os.environ.get("KAYBEE_MODEL_RETRY_RATIO", "0.2"))),
+        )
+
+    def _has_capacity(self, agent: str) -> bool:
+        limit = self.agent_concurrency.get(agent)
+        return self.in_flight < self.max_concurrency and (
+            limit is None or self.agent_in_flight[agent] < limit
+        )
+
+    def _grant(self, agent: str) -> None:
+        self.in_flight += 1
+        self.agent_in_flight[agent] += 1
+
+    def _release(self, agent: str) -> None:
+        self.in_flight -= 1
+        self.agent_in_flight[agent] -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admits waiting calls, taking one tenant at a time in round robin order."""
+        while self._waiting and self.in_flight < self.max_concurrency:
+            for tenant, queue in list(self._waiting.items()):
+                waiter = next(
+                    (waiter for waiter in queue if not waiter[1].done() and self._has_capacity(waiter[0])),
+                    None,
+                )
+                for done in [waiter for waiter in queue if waiter[1].done()]:
+                    queue.remove(done)
+                if waiter is not None:
+                    queue.remove(waiter)
+                    self._grant(waiter[0])
+                    waiter[1].set_result(None)
+                if not queue:
+                    del self._waiting[tenant]
+                elif waiter is not None:
+                    self._waiting.move_to_end(tenant)
+                if waiter is not None:
+                    break
+            else:
+                # Nothing waiting can start until a call finishes.
+                return
+
+    @asynccontextmanager
+    async def admit(self, agent: str, tenant: str = ""):
+        """Holds a slot for one model call by `agent` on behalf of `tenant`."""
+        start = time.perf_counter()
+        if not self._waiting and self._has_capacity(agent):
+            self._grant(agent)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiting.setdefault(tenant, collections.deque()).append((agent, future))
+            # Calls already waiting may be held back only by their own agent's
+            # limit, in which case this one can start right away.
+            self._dispatch()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release(agent)
+                raise
+        try:
+            if self.bucket:
+                await self.bucket.acquire()
+            QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start, agent=agent)
+            yield
+        finally:
+            self._release(agent)
+
+    def _should_retry(self, e: Exception, attempt: int, agent: str) -> bool:
+        if not self.is_retryable(e) or attempt >= self.max_retries:
+            MODEL_CALL_ATTEMPTS.inc(agent=agent, outcome="error")
+            return False
+        if not self.retry_budget.try_withdraw():
+            MODEL_CALL_ATTEMPTS.inc(agent=agent, outcome="retry_budget_exhausted")
+            return False
+        MODEL_CALL_ATTEMPTS.inc(agent=agent, outcome="retried")
+        return True
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter, so that retries from concurrent calls spread out.
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+
+    async def _produce(
+        self, start: Callable[[], AsyncIterator[T]], agent: str, tenant: str, queue: asyncio.Queue
+    ) -> None:
+        """Puts the items of `start()` on `queue` once admitted, retrying it if it is rate limited before producing anything."""
+        try:
+            self.retry_budget.deposit()
+            for attempt in itertools.count():
+                produced = False
+                async with self.admit(agent, tenant):
+                    try:
+                        async for item in start():
+                            produced = True
+                            queue.put_nowait(item)
+                        MODEL_CALL_ATTEMPTS.inc(agent=agent, outcome="ok")
+                        return
+                    except Exception as e:
+                        if produced or not self._should_retry(e, attempt, agent):
+                            raise
+                await asyncio.sleep(self._backoff(attempt))
+        finally:
+            queue.put_nowait(_DONE)
+
+    async def stream(self, start: Callable[[], AsyncIterator[T]], agent: str, tenant: str = "") -> AsyncIterator[T]:
+        """
+        Iterates `start()` once admitted, retrying it if it is rate limited
+        before producing anything.
+
+        The slot is held only while `start()` is being iterated, by a separate
+        task, and not while the caller handles the items. ADK runs tool calls
+        and transfers to sub-agents while it handles a model response, and those
+        make model calls of their own; holding the slot across them would let
+        delegating calls fill every slot and wait forever on their children.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        producer = asyncio.create_task(self._produce(start, agent, tenant, queue))
+        try:
+            while (item := await queue.get()) is not _DONE:
+                yield item
+            # Raises the call's exception, if it failed.
+            await producer
+        finally:
+            producer.cancel()
+
+
+controller = AdmissionController.from_env()
+
+
+class AdmittedGemini(Gemini):
+    """A Gemini model whose calls go through the process's AdmissionController."""
+
+    agent_name: str = ""
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncIterator[LlmResponse]:
+        generate = super().generate_content_async
+        async for response in controller.stream(
+            lambda: generate(llm_request, stream),
+            agent=self.agent_name,
+            tenant=current_tenant.get(),
+        ):
+            yield response
+
+
+def set_tenant(callback_context: CallbackContext) -> Optional[types.Content]:
+    """before_agent_callback that attributes the invocation's model calls to its user."""
+    current_tenant.set(callback_context._invocation_context.user_id)
+    return None
@@ -0,0 +1,79 @@
+"""Bounded in-process result caches.
+
+Each cache holds up to `max_size` entries for up to `ttl` seconds, evicting the
+least recently used entry when full. Lookups are counted per cache and outcome
+in kaybee_cache_requests_total, from which hit ratios can be computed, e.g.
+
+    sum by (cache) (rate(kaybee_cache_requests_total{outcome="hit"}[5m]))
+      / sum by (cache) (rate(kaybee_cache_requests_total[5m]))
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any, Optional
+
+from kaybee_agent import metrics
+
+CACHE_REQUESTS = metrics.Counter(
+    "kaybee_cache_requests_total",
+    "Result cache lookups by cache and outcome (hit, miss, expired).",
+    labelnames=("cache", "outcome"),
+)
+CACHE_EVICTIONS = metrics.Counter(
+    "kaybee_cache_evictions_total",
+    "Result cache entries evicted to make room, or invalidated.",
+    labelnames=("cache",),
+)
+
+
+class TTLCache:
+    """A thread-safe LRU cache whose entries also expire after `ttl` seconds."""
+
+    def __init__(self, name: str, max_size: int, ttl: float):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value for `key`, or None if there is none or it has expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry, outcome = None, "expired"
+            else:
+                outcome = "miss" if entry is None else "hit"
+            if entry is not None:
+                self._entries.move_to_end(key)
+        CACHE_REQUESTS.inc(cache=self.name, outcome=outcome)
+        return None if entry is None else entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_size <= 0:
+            return
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            CACHE_EVICTIONS.inc(evicted, cache=self.name)
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Removes every entry whose key satisfies `predicate`, returning how many were removed."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                del self._entries[key]
+        if keys:
+            CACHE_EVICTIONS.inc(len(keys), cache=self.name)
+        return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._entries)
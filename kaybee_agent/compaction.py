@@ -0,0 +1,256 @@
+"""Deduplication and compaction of stored knowledge graphs.
+
+Merges create a new entity whenever fuzzy matching misses an alias, and
+relationships can outlive the entities they connect. Compaction clusters
+duplicate entities, merges their names, properties and relationships, drops
+dangling and duplicate relationships, and writes the graph back only if it
+hasn't changed in the meantime.
+
+Two entities are duplicates if their primary names (the first of their names)
+are the same once case, punctuation and spacing are ignored, or if at least
+MIN_NAME_MATCHES of their names match, exactly or fuzzily (at a stricter
+threshold than retrieval uses). A single shared alias, like "Sam" for both "Sam
+Smith" and "Sam Jones", is one match and isn't enough. Names that differ in
+their numbers ("Quarterly Report 2023 Q1" and "...Q2") never match. Use
+--dry-run to review the proposed clusters before writing.
+
+    python -m kaybee_agent.compaction USER_ID [USER_ID ...] [--dry-run]
+    python -m kaybee_agent.compaction --all
+"""
+
+import argparse
+import json
+import logging
+import re
+from typing import Optional
+
+from google.api_core.exceptions import PreconditionFailed
+from pydantic import BaseModel
+from thefuzz import fuzz
+
+from kaybee_agent import graph_index, graph_store
+from kaybee_agent.environment import setup_environment
+
+# Names scoring above this match fuzzily. This is stricter than the retrieval
+# threshold, since merging entities can't be undone.
+DEFAULT_THRESHOLD = 95
+
+# Distinct name matches needed to treat two entities as one, when their primary
+# names differ.
+MIN_NAME_MATCHES = 2
+
+# Attempts at writing a compacted graph when it changes underneath us.
+WRITE_ATTEMPTS = 3
+
+
+class CompactionReport(BaseModel):
+    """How much a graph shrank."""
+    graph_id: str
+    entities_before: int
+    entities_after: int
+    relationships_before: int
+    relationships_after: int
+    bytes_before: int
+    bytes_after: int
+    merged_entities: int
+    dangling_relationships: int
+    duplicate_relationships: int
+    version: int
+    # The names of the entities in each cluster merged (or, in a dry run, to be merged), by entity ID.
+    clusters: list[dict[str, list[str]]] = []
+    written: bool = False
+
+
+def _normalize(name: str) -> str:
+    return " ".join(re.findall(r"\w+", name.lower()))
+
+
+def _distinct_names(name: str, other_name: str) -> bool:
+    """Whether two similar names likely name different things, because they differ in their numbers."""
+    return re.findall(r"\d+", name) != re.findall(r"\d+", other_name)
+
+
+def _cluster_duplicates(index: graph_index.GraphIndex, threshold: int) -> list[set[str]]:
+    """Returns clusters of two or more entities that are duplicates of each other (see the module docstring)."""
+    parents = {entity_id: entity_id for entity_id in index.g['entities']}
+
+    def find(entity_id):
+        while parents[entity_id] != entity_id:
+            parents[entity_id] = parents[parents[entity_id]]
+            entity_id = parents[entity_id]
+        return entity_id
+
+    def union(entity_id, other_id):
+        parents[find(other_id)] = find(entity_id)
+
+    by_primary_name = {}
+    for entity_id, entity in index.g['entities'].items():
+        primary_name = _normalize(entity['entity_names'][0]) if entity['entity_names'] else ""
+        if primary_name:
+            by_primary_name.setdefault(primary_name, []).append(entity_id)
+    for entity_ids in by_primary_name.values():
+        for other_id in entity_ids[1:]:
+            union(entity_ids[0], other_id)
+
+    names = [(_normalize(name), entity_id) for name, entity_id in index.names]
+
+    # fuzz.ratio can't exceed 200 * len(shorter) / (len(shorter) + len(longer)),
+    # so with names sorted by length, each name only needs comparing with the
+    # slightly longer names that follow it.
+    names = sorted(set(names), key=lambda name: len(name[0]))
+    name_matches = {}
+    for i, (name, entity_id) in enumerate(names):
+        for other_name, other_id in names[i + 1:]:
+            if 200 * len(name) <= threshold * (len(name) + len(other_name)):
+                break
+            if (
+                other_id != entity_id
+                and fuzz.ratio(name, other_name) > threshold
+                and not _distinct_names(name, other_name)
+            ):
+                name_matches.setdefault(frozenset((entity_id, other_id)), set()).add((name, other_name))
+    for pair, matches in name_matches.items():
+        # Distinct names on both sides, so that one name close to two aliases isn't two matches.
+        if min(len({name for name, _ in matches}), len({other for _, other in matches})) >= MIN_NAME_MATCHES:
+            union(*pair)
+
+    clusters = {}
+    for entity_id in parents:
+        clusters.setdefault(find(entity_id), set()).add(entity_id)
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+
+def _merge_entities(index: graph_index.GraphIndex, cluster: set[str]) -> tuple[str, dict]:
+    """Returns the ID of the entity a cluster is merged into, and the merged entity."""
+    # The best connected entity survives, so that the fewest relationships move.
+    canonical_id = min(cluster, key=lambda entity_id: (-len(index.relationships.get(entity_id, [])), entity_id))
+    ordered = [canonical_id] + sorted(cluster - {canonical_id})
+
+    entity_names, seen = [], set()
+    properties = {}
+    for entity_id in ordered:
+        entity = index.g['entities'][entity_id]
+        for name in entity['entity_names']:
+            if name.lower() not in seen:
+                seen.add(name.lower())
+                entity_names.append(name)
+        # Earlier (better connected) entities win conflicting properties.
+        properties = (entity.get('properties') or {}) | properties
+
+    return canonical_id, index.g['entities'][canonical_id] | {
+        'entity_names': entity_names,
+        'properties': properties,
+    }
+
+
+def compact_graph(
+    index: graph_index.GraphIndex, graph_id: str, threshold: int = DEFAULT_THRESHOLD
+) -> tuple[dict, CompactionReport]:
+    """
+    Args:
+        index (GraphIndex): The index of the graph to compact.
+        graph_id (str): The graph's ID, for the report.
+        threshold (int): Names scoring above this are treated as the same entity.
+
+    Returns:
+        tuple[dict, CompactionReport]: The compacted graph (a new dict) and how much it shrank.
+    """
+    g = index.g
+    entities = dict(g['entities'])
+    id_mapping = {}
+    clusters = _cluster_duplicates(index, threshold)
+    for cluster in clusters:
+        canonical_id, merged = _merge_entities(index, cluster)
+        for entity_id in cluster - {canonical_id}:
+            id_mapping[entity_id] = canonical_id
+            del entities[entity_id]
+        entities[canonical_id] = merged
+
+    relationships, seen = [], set()
+    dangling = duplicates = 0
+    for rel in g['relationships']:
+        source = id_mapping.get(rel['source_entity_id'], rel['source_entity_id'])
+        target = id_mapping.get(rel['target_entity_id'], rel['target_entity_id'])
+        if source not in entities or target not in entities:
+            dangling += 1
+            continue
+        key = (source, target, rel['relationship'])
+        # A relationship between two duplicates becomes a self-loop; drop it too.
+        if key in seen or (source == target and rel['source_entity_id'] != rel['target_entity_id']):
+            duplicates += 1
+            continue
+        seen.add(key)
+        relationships.append(rel | {'source_entity_id': source, 'target_entity_id': target})
+
+    compacted = {'entities': entities, 'relationships': relationships}
+    report = CompactionReport(
+        graph_id=graph_id,
+        entities_before=len(g['entities']),
+        entities_after=len(entities),
+        relationships_before=len(g['relationships']),
+        relationships_after=len(relationships),
+        bytes_before=len(json.dumps(g, indent=2)),
+        bytes_after=len(json.dumps(compacted, indent=2)),
+        merged_entities=len(id_mapping),
+        dangling_relationships=dangling,
+        duplicate_relationships=duplicates,
+        version=index.version,
+        clusters=[
+            {entity_id: g['entities'][entity_id]['entity_names'] for entity_id in sorted(cluster)}
+            for cluster in clusters
+        ],
+    )
+    return compacted, report
+
+
+def compact(graph_id: str, threshold: int = DEFAULT_THRESHOLD, dry_run: bool = False) -> Optional[CompactionReport]:
+    """
+    Compacts a stored graph, writing it back only if it is still at the version
+    that was compacted. Returns None if the graph doesn't exist.
+    """
+    for attempt in range(WRITE_ATTEMPTS):
+        index = graph_index.get_graph_index(graph_id, stage="compact")
+        if not index.version:
+            return None
+
+        compacted, report = compact_graph(index, graph_id, threshold=threshold)
+        unchanged = (
+            report.entities_after == report.entities_before
+            and report.relationships_after == report.relationships_before
+            and not report.merged_entities
+        )
+        if dry_run or unchanged:
+            return report
+
+        try:
+            report.version = graph_store.store_knowledge_graph(
+                compacted, graph_id, if_version_match=index.version, stage="compact")
+        except PreconditionFailed:
+            logging.warning(
+                "Graph %s changed during compaction (attempt %d of %d); compacting again.",
+                graph_id, attempt + 1, WRITE_ATTEMPTS)
+            continue
+        report.written = True
+        return report
+    raise RuntimeError(f"Could not compact graph {graph_id}: it kept changing.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Deduplicate entities and drop dangling relationships in knowledge graphs.")
+    parser.add_argument("graph_ids", nargs="*", help="graphs (user IDs) to compact")
+    parser.add_argument("--all", action="store_true", help="compact every stored graph")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD, help="fuzzy name score above which names match")
+    parser.add_argument("--dry-run", action="store_true", help="report, with the proposed clusters, without writing")
+    args = parser.parse_args()
+    if not args.graph_ids and not args.all:
+        parser.error("give one or more graph IDs, or --all")
+
+    setup_environment()
+    for graph_id in graph_store.list_graph_ids() if args.all else args.graph_ids:
+        report = compact(graph_id, threshold=args.threshold, dry_run=args.dry_run)
+        if report:
+            print(report.model_dump_json())
+
+
+if __name__ == "__main__":
+    main()
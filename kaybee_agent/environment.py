@@ -0,0 +1,27 @@
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+
+def setup_environment():
+    # Load environment variables from .env file in root directory
+    root_dir = Path(__file__).parent.parent
+    dotenv_path = root_dir / ".env"
+    load_dotenv(dotenv_path=dotenv_path)
+
+    # Probing credentials can cost a metadata server round trip, so only do it
+    # when the project isn't configured already.
+    if "GOOGLE_CLOUD_PROJECT" not in os.environ:
+        import google.auth
+
+        # Use default project from credentials if not in .env
+        try:
+            _, project_id = google.auth.default()
+            os.environ.setdefault("GOOGLE_CLOUD_PROJECT", project_id)
+        except google.auth.exceptions.DefaultCredentialsError:
+            # This will happen in the test environment.
+            # The tests will set the required environment variables.
+            return
+    os.environ.setdefault("GOOGLE_CLOUD_LOCATION", "global")
+    os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "True")
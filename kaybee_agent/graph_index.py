@@ -0,0 +1,120 @@
+"""In-memory indexes over a knowledge graph, cached per graph version.
+
+Indexes are built once per version of a graph and shared by the agent's tools
+and the server's read API, so that lookups don't rescan the whole graph.
+"""
+
+import threading
+from collections import OrderedDict
+
+from thefuzz import fuzz
+
+from kaybee_agent import graph_store, inflight
+
+
+class GraphIndex:
+    """Alias, adjacency and relationship indexes over one version of a knowledge graph."""
+
+    def __init__(self, g: dict, version: int):
+        """
+        Args:
+            g (dict): The knowledge graph. It must not change while indexed.
+            version (int): The graph's version.
+        """
+        self.g = g
+        self.version = version
+        self.sorted_entity_ids = sorted(g['entities'])
+
+        # Lowercased names, for exact alias lookups and fuzzy matching.
+        self.names: list[tuple[str, str]] = []
+        self.aliases: dict[str, set[str]] = {}
+        for entity_id, entity in g['entities'].items():
+            for name in entity['entity_names']:
+                self.names.append((name.lower(), entity_id))
+                self.aliases.setdefault(name.lower(), set()).add(entity_id)
+
+        # Undirected adjacency, and each entity's relationships in either direction.
+        self.neighbors: dict[str, set[str]] = {}
+        self.relationships: dict[str, list[dict]] = {}
+        for rel in g['relationships']:
+            source, target = rel['source_entity_id'], rel['target_entity_id']
+            self.neighbors.setdefault(source, set()).add(target)
+            self.neighbors.setdefault(target, set()).add(source)
+            self.relationships.setdefault(source, []).append(rel)
+            if target != source:
+                self.relationships.setdefault(target, []).append(rel)
+
+    def lookup_alias(self, name: str) -> set[str]:
+        """Returns the IDs of the entities with `name` as one of their names, ignoring case."""
+        return self.aliases.get(name.lower(), set())
+
+    def find_entity_ids_by_name(self, entity_name: str, threshold: int = 80) -> set[str]:
+        """Finds entities by their name or one of their synonyms using fuzzy string matching."""
+        entity_name = entity_name.lower()
+        return {
+            entity_id
+            for name, entity_id in self.names
+            if fuzz.ratio(entity_name, name) > threshold
+        }
+
+    def expand(self, entity_ids: set[str], hops: int = 2) -> set[str]:
+        """Returns entity_ids together with every entity within `hops` relationships of them."""
+        neighborhood = set(entity_ids)
+        frontier = set(entity_ids)
+        for _ in range(hops):
+            frontier = {
+                nbr for entity_id in frontier
+                for nbr in self.neighbors.get(entity_id, ())
+            } - neighborhood
+            neighborhood |= frontier
+        return neighborhood
+
+    def subgraph(self, entity_ids: set[str]) -> dict:
+        """Returns the entities in `entity_ids` and the relationships among them.
+
+        This is equivalent to graph_store.extract_subgraph, but only visits the
+        relationships of the given entities.
+        """
+        entity_ids = set(entity_ids)
+        relationships = {
+            id(rel): rel
+            for entity_id in entity_ids
+            for rel in self.relationships.get(entity_id, ())
+            if rel['source_entity_id'] in entity_ids and rel['target_entity_id'] in entity_ids
+        }
+        return {
+            'entities': {
+                entity_id: self.g['entities'][entity_id]
+                for entity_id in entity_ids
+                if entity_id in self.g['entities']
+            },
+            'relationships': list(relationships.values()),
+        }
+
+
+_indexes: "OrderedDict[tuple[str, int], GraphIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+_builds = inflight.SingleFlight("graph_index")
+
+
+def index_graph(graph_id: str, g: dict, version: int) -> GraphIndex:
+    """Returns the index of a graph version, building and caching it if needed."""
+    key = (graph_id, version)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    index = _builds.do(key, lambda: GraphIndex(g, version))
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > graph_store.CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def get_graph_index(graph_id: str, stage: str = "fetch", max_staleness: float = 0.0) -> GraphIndex:
+    """Fetches the latest version of a graph (see graph_store.fetch_knowledge_graph) and returns its index."""
+    g, version = graph_store.fetch_knowledge_graph(graph_id, stage=stage, max_staleness=max_staleness)
+    return index_graph(graph_id, g, version)
@@ -0,0 +1,209 @@
+"""Knowledge graph storage in Google Cloud Storage, behind a version-aware cache.
+
+Each tenant graph is a single JSON blob named after its graph id. The blob's
+GCS generation is used as the graph version: it changes on every write, and a
+version of 0 means the graph doesn't exist yet.
+
+Graphs returned from this module are shared with the cache and must be treated
+as read-only; build a new dict to change one.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from dotenv import load_dotenv
+from google.cloud import storage
+
+from kaybee_agent import inflight, metrics
+
+load_dotenv()
+
+CACHE_SIZE = int(os.environ.get("KAYBEE_GRAPH_CACHE_SIZE", "64"))
+
+_cache: "OrderedDict[tuple[str, int], dict]" = OrderedDict()
+# The latest version seen for each graph, and when it was seen (time.monotonic).
+_latest: dict[str, tuple[int, float]] = {}
+_cache_lock = threading.Lock()
+# Fetches of the latest version of a graph, joined by concurrent fetches of the
+# same graph (e.g. a tool call arriving while a prefetch is still downloading).
+# Fetches are keyed by the number of writes this process has made to the graph,
+# so that a fetch following a write never joins one that started before it.
+_fetches = inflight.SingleFlight("graph_fetch")
+_writes: dict[str, int] = {}
+
+
+def empty_graph() -> dict:
+    return {"entities": {}, "relationships": []}
+
+
+@functools.cache
+def _get_bucket():
+    storage_client = storage.Client()
+    bucket_name = os.environ.get("KNOWLEDGE_GRAPH_BUCKET")
+    if not bucket_name:
+        raise ValueError("KNOWLEDGE_GRAPH_BUCKET environment variable not set.")
+    return storage_client.bucket(bucket_name)
+
+
+def _cache_put(graph_id: str, version: int, g: dict) -> None:
+    with _cache_lock:
+        _latest[graph_id] = (version, time.monotonic())
+        _cache[(graph_id, version)] = g
+        _cache.move_to_end((graph_id, version))
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def get_cached_graph(graph_id: str, version: int) -> Optional[dict]:
+    """Returns the graph at `version` if it's in the cache, without any I/O."""
+    with _cache_lock:
+        g = _cache.get((graph_id, version))
+        if g is not None:
+            _cache.move_to_end((graph_id, version))
+        return g
+
+
+def fetch_knowledge_graph(
+    graph_id: str, stage: str = "fetch", max_staleness: float = 0.0
+) -> tuple[dict, int]:
+    """
+    Fetches the latest version of a knowledge graph.
+
+    Only the blob's metadata is read when the cache already holds the latest
+    version; otherwise the blob is downloaded and parsed. A fetch of a graph
+    that is already being fetched waits for that fetch and returns its result,
+    unless this process has stored the graph since that fetch started.
+
+    Args:
+        graph_id (str): The graph to fetch.
+        stage (str): The pipeline stage fetching the graph, used to tag metrics.
+        max_staleness (float): Seconds for which a version this process has
+            seen as the latest may be served without checking storage again.
+
+    Returns:
+        tuple[dict, int]: The graph and its version.
+    """
+    if max_staleness > 0:
+        with _cache_lock:
+            version, seen_at = _latest.get(graph_id, (None, 0.0))
+        if version is not None and time.monotonic() - seen_at <= max_staleness:
+            g = get_cached_graph(graph_id, version)
+            if g is not None:
+                return g, version
+
+    with _cache_lock:
+        writes = _writes.get(graph_id, 0)
+    return _fetches.do((graph_id, writes), lambda: _fetch_latest(graph_id, stage))
+
+
+def _fetch_latest(graph_id: str, stage: str) -> tuple[dict, int]:
+    blob = _get_bucket().get_blob(f"{graph_id}.json")
+    if blob is None:
+        return empty_graph(), 0
+
+    g = get_cached_graph(graph_id, blob.generation)
+    if g is not None:
+        with _cache_lock:
+            _latest[graph_id] = (blob.generation, time.monotonic())
+        return g, blob.generation
+
+    start = time.perf_counter()
+    content = blob.download_as_bytes()
+    downloaded = time.perf_counter()
+    g = json.loads(content)
+    parsed = time.perf_counter()
+
+    size_bucket = metrics.tenant_size_bucket(len(g["entities"]))
+    metrics.STAGE_SECONDS.observe(downloaded - start, stage=f"{stage}_fetch", size_bucket=size_bucket)
+    metrics.STAGE_SECONDS.observe(parsed - downloaded, stage=f"{stage}_parse", size_bucket=size_bucket)
+    metrics.GRAPH_FETCH_BYTES.observe(len(content), stage=f"{stage}_fetch", size_bucket=size_bucket)
+
+    _cache_put(graph_id, blob.generation, g)
+    return g, blob.generation
+
+
+def store_knowledge_graph(
+    knowledge_graph: dict,
+    graph_id: str,
+    if_version_match: Optional[int] = None,
+    stage: str = "store",
+) -> int:
+    """
+    Stores a knowledge graph, replacing the current version.
+
+    Args:
+        knowledge_graph (dict): The full graph to store.
+        graph_id (str): The graph to replace.
+        if_version_match (Optional[int]): If given, the write only succeeds if the
+            stored graph is still at this version (0 meaning it must not exist),
+            and raises google.api_core.exceptions.PreconditionFailed otherwise.
+        stage (str): The pipeline stage storing the graph, used to tag metrics.
+
+    Returns:
+        int: The new version of the graph.
+    """
+    size_bucket = metrics.tenant_size_bucket(len(knowledge_graph["entities"]))
+    with metrics.STAGE_SECONDS.time(stage=f"{stage}_upload", size_bucket=size_bucket):
+        content = json.dumps(knowledge_graph, indent=2)
+        blob = _get_bucket().blob(f"{graph_id}.json")
+        blob.upload_from_string(
+            content,
+            content_type="application/json",
+            if_generation_match=if_version_match,
+        )
+    metrics.GRAPH_STORE_BYTES.observe(len(content), stage=f"{stage}_upload", size_bucket=size_bucket)
+
+    with _cache_lock:
+        _writes[graph_id] = _writes.get(graph_id, 0) + 1
+    _cache_put(graph_id, blob.generation, knowledge_graph)
+    return blob.generation
+
+
+def list_graph_ids() -> list[str]:
+    """Returns the IDs of every stored knowledge graph."""
+    return [
+        blob.name.removesuffix(".json")
+        for blob in _get_bucket().list_blobs()
+        if blob.name.endswith(".json")
+    ]
+
+
+def extract_subgraph(g: dict, entity_ids) -> dict:
+    """Returns the entities in `entity_ids` and the relationships among them."""
+    entity_ids = set(entity_ids)
+    return {
+        'entities': {
+            entity_id: g['entities'][entity_id]
+            for entity_id in entity_ids
+            if entity_id in g['entities']
+        },
+        'relationships': [
+            rel for rel in g['relationships']
+            if rel['source_entity_id'] in entity_ids and rel['target_entity_id'] in entity_ids
+        ],
+    }
+
+
+def make_ref(version: int, entity_ids) -> dict:
+    """Returns a compact, session-state-friendly reference to a subgraph."""
+    return {'graph_version': version, 'entity_ids': sorted(entity_ids)}
+
+
+def resolve_ref(graph_id: str, ref: Optional[dict]) -> dict:
+    """
+    Resolves a reference made by `make_ref` back into a subgraph.
+
+    The subgraph is taken from the referenced version when it's still cached, and
+    from the latest version otherwise.
+    """
+    if not ref:
+        return empty_graph()
+    g = get_cached_graph(graph_id, ref['graph_version'])
+    if g is None:
+        g, _ = fetch_knowledge_graph(graph_id, stage="resolve")
+    return extract_subgraph(g, ref['entity_ids'])
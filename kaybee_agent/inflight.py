@@ -0,0 +1,49 @@
+"""Deduplication of concurrent loads of the same thing."""
+
+import threading
+from collections.abc import Callable, Hashable
+from concurrent.futures import Future
+from typing import Any
+
+from kaybee_agent import metrics
+
+INFLIGHT_CALLS = metrics.Counter(
+    "kaybee_inflight_calls_total",
+    "Deduplicated loads by kind and outcome (ran, or joined a load already in flight).",
+    labelnames=("kind", "outcome"),
+)
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers asking for a key whose
+    call is already in flight, in any thread, wait for it and share its result
+    (or exception) instead of starting another.
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._calls: dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            joined = future is not None
+            if not joined:
+                future = self._calls[key] = Future()
+        INFLIGHT_CALLS.inc(kind=self.kind, outcome="joined" if joined else "ran")
+        if joined:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -0,0 +1,376 @@
+"""Bulk ingestion of conversation snippets into a tenant's knowledge graph.
+
+The corpus is a JSONL file with one {"text": ...} snippet per line. Facts are
+extracted from the snippets concurrently with `knowledge_updates_agent`, grouped
+by the entities they touch, and merged with one merge call per group of
+overlapping neighborhoods. The graph is committed once per batch of snippets,
+and a checkpoint lets an interrupted run resume after the last committed batch.
+
+    python -m kaybee_agent.ingestion corpus.jsonl --graph-id USER_ID \\
+        --concurrency 8 --batch-size 50 --checkpoint corpus.checkpoint.json
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+from collections.abc import Iterable, Iterator
+from typing import Optional
+
+from google.adk.agents import Agent
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.api_core.exceptions import PreconditionFailed
+from google.genai import types
+from pydantic import BaseModel
+
+from kaybee_agent import admission, graph_index, graph_store, vector_index
+from kaybee_agent.environment import setup_environment
+from kaybee_agent.subagents.knowledge_graph_agent.subagents.existing_knowledge_agent.tools import (
+    SEMANTIC_MIN_SCORE,
+    SEMANTIC_TOP_K,
+    expand_neighborhoods,
+)
+from kaybee_agent.subagents.knowledge_graph_agent.subagents.merge_knowledge_agent import agent as merge_knowledge_agent
+from kaybee_agent.subagents.knowledge_graph_agent.subagents.merge_knowledge_agent.agent import PROMPT as MERGE_PROMPT
+from kaybee_agent.subagents.knowledge_graph_agent.subagents.merge_knowledge_agent.schemas import KnowledgeGraph
+from kaybee_agent.subagents.knowledge_graph_agent.subagents.merge_knowledge_agent.tools import _reformat_graph, merge_subgraph
+from kaybee_agent.subagents.knowledge_graph_agent.subagents.new_knowledge_agent import agent as knowledge_updates_agent
+
+APP_NAME = "kaybee_ingestion"
+
+# Attempts at committing a batch when the graph changes underneath it.
+COMMIT_ATTEMPTS = 3
+
+# Attempts at merging a group of facts when the model's response can't be parsed.
+MERGE_ATTEMPTS = 2
+
+# Most facts merged together when they touch no known entity.
+NEW_FACTS_PER_MERGE = 50
+
+# Longest entity name, in words, that is looked for in extracted facts.
+MAX_NAME_WORDS = 6
+
+# Candidate names searched for in the vector index at a time.
+SEARCH_CHUNK_SIZE = 1000
+
+_WORD = re.compile(r"\w+")
+
+
+class IngestionProgress(BaseModel):
+    """Progress of an ingestion run. This is also the checkpoint format."""
+    graph_id: str
+    snippets_read: int = 0
+    snippets_committed: int = 0
+    facts_extracted: int = 0
+    batches_committed: int = 0
+    graph_version: int = 0
+    done: bool = False
+    error: Optional[str] = None
+
+
+# The fields of a checkpoint that a resumed run picks up from.
+CHECKPOINT_COUNTERS = ("snippets_committed", "facts_extracted", "batches_committed")
+
+
+def read_corpus(path: str) -> Iterator[str]:
+    """Yields the text of each snippet in a JSONL corpus, one line at a time."""
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)["text"]
+
+
+async def _run_agent(agent: Agent, graph_id: str, text: str) -> Optional[str]:
+    """Runs an agent on one message in a throwaway session and returns its final response text."""
+    # Runs in its own task, so this only attributes this agent's model calls.
+    admission.current_tenant.set(graph_id)
+    session_service = InMemorySessionService()
+    runner = Runner(agent=agent, app_name=APP_NAME, session_service=session_service)
+    session = await session_service.create_session(app_name=APP_NAME, user_id=graph_id)
+
+    final_text = None
+    async for event in runner.run_async(
+        user_id=graph_id,
+        session_id=session.id,
+        new_message=types.Content(role="user", parts=[types.Part(text=text)]),
+    ):
+        if event.is_final_response() and event.content and event.content.parts:
+            final_text = event.content.parts[-1].text
+    return final_text
+
+
+async def _extract(graph_id: str, snippet: str) -> list[str]:
+    """Returns the facts `knowledge_updates_agent` extracts from a snippet."""
+    text = await _run_agent(knowledge_updates_agent, graph_id, snippet)
+    try:
+        return json.loads(text)["knowledge"]
+    except (TypeError, ValueError, KeyError):
+        logging.warning("Could not parse extracted knowledge: %r", text)
+        return []
+
+
+async def _merge(graph_id: str, existing_knowledge: dict, facts: list[str]) -> Optional[dict]:
+    """
+    Returns the merged replacement for `existing_knowledge`, as returned by
+    _reformat_graph, or None if the model's response couldn't be parsed.
+    """
+    prompt = MERGE_PROMPT.format(
+        existing_knowledge=json.dumps(existing_knowledge),
+        knowledge_updates=json.dumps({"knowledge": facts}),
+    )
+    # Unlike merge_knowledge_agent, this doesn't store the graph after every
+    # merge; the whole batch is committed at once.
+    agent = Agent(
+        name="batch_merge_knowledge_agent",
+        model=merge_knowledge_agent.model,
+        planner=merge_knowledge_agent.planner,
+        instruction=lambda _: prompt,
+        output_schema=KnowledgeGraph,
+    )
+    for attempt in range(MERGE_ATTEMPTS):
+        text = await _run_agent(agent, graph_id, "Apply the updates to the knowledge graph.")
+        try:
+            return _reformat_graph(json.loads(text))
+        except (TypeError, ValueError, KeyError):
+            logging.warning(
+                "Could not parse merged knowledge (attempt %d of %d): %r", attempt + 1, MERGE_ATTEMPTS, text)
+    return None
+
+
+def _candidate_names(facts: list[str]) -> set[str]:
+    """Returns the runs of up to MAX_NAME_WORDS words in the facts, which might name entities."""
+    candidates = set()
+    for fact in facts:
+        words = _WORD.findall(fact.lower())
+        for n in range(1, MAX_NAME_WORDS + 1):
+            for i in range(len(words) - n + 1):
+                candidates.add(" ".join(words[i:i + n]))
+    return candidates
+
+
+def _match_names(graph_id: str, index: graph_index.GraphIndex, names: set[str]) -> dict[str, tuple[set[str], set[str]]]:
+    """
+    Matches names the way get_relevant_neighborhoods does.
+
+    Returns:
+        dict[str, tuple[set[str], set[str]]]: For each name, the IDs of the
+            entities it matches fuzzily, and of those it only matches semantically.
+    """
+    names = sorted(names)
+    vectors = vector_index.get_vector_index(graph_id, index.g, index.version)
+    # In chunks, so that a large batch doesn't score every name against every entity at once.
+    semantic_matches = [
+        match
+        for chunk in itertools.batched(names, SEARCH_CHUNK_SIZE)
+        for match in vectors.search(list(chunk), k=SEMANTIC_TOP_K, min_score=SEMANTIC_MIN_SCORE)
+    ]
+    matches = {}
+    for name, semantic in zip(names, semantic_matches):
+        fuzzy = index.find_entity_ids_by_name(name)
+        matches[name] = (fuzzy, {entity_id for entity_id, _ in semantic} - fuzzy)
+    return matches
+
+
+def _group_facts(
+    graph_id: str, index: graph_index.GraphIndex, extractions: list[list[str]]
+) -> list[tuple[list[str], set[str]]]:
+    """
+    Args:
+        graph_id (str): The graph the facts will be merged into.
+        index (GraphIndex): The index of the knowledge graph the facts will be merged into.
+        extractions (list[list[str]]): The facts extracted from each snippet, in corpus order.
+
+    Returns:
+        list[tuple[list[str], set[str]]]: Groups of facts, each with the IDs of the
+            neighborhood they are merged into. No two neighborhoods overlap, so the
+            groups can be merged independently.
+    """
+    extractions = [facts for facts in extractions if facts]
+    candidates = [_candidate_names(facts) for facts in extractions]
+    # Each name is matched once per batch, however many snippets mention it.
+    matches = _match_names(graph_id, index, set().union(*candidates))
+
+    touching, untouched_facts = [], []
+    for facts, names in zip(extractions, candidates):
+        fuzzy = set().union(*[matches[name][0] for name in names])
+        semantic = set().union(*[matches[name][1] for name in names]) - fuzzy
+        if fuzzy or semantic:
+            touching.append((facts, fuzzy, semantic))
+        else:
+            untouched_facts.extend(facts)
+
+    # As in get_relevant_neighborhoods, only fuzzy matches bring their neighborhoods.
+    neighborhoods = [
+        neighborhood | semantic
+        for neighborhood, (_, _, semantic) in zip(
+            expand_neighborhoods(index, [fuzzy for _, fuzzy, _ in touching]), touching)
+    ]
+    groups = []
+    for (facts, _, _), neighborhood in zip(touching, neighborhoods):
+        for group in [group for group in groups if group[1] & neighborhood]:
+            groups.remove(group)
+            facts = group[0] + facts
+            neighborhood = group[1] | neighborhood
+        groups.append((facts, neighborhood))
+
+    # Facts that touch no known entity are merged in chunks, so that a new
+    # entity mentioned by several snippets is usually created only once,
+    # without any one merge call growing with the batch.
+    for facts in itertools.batched(untouched_facts, NEW_FACTS_PER_MERGE):
+        groups.append((list(facts), set()))
+    return groups
+
+
+def _load_checkpoint(path: Optional[str]) -> Optional[dict]:
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+def _save_checkpoint(path: Optional[str], progress: IngestionProgress) -> None:
+    if not path:
+        return
+    # Write then rename, so that a crash never leaves a truncated checkpoint.
+    with open(f"{path}.tmp", "w") as f:
+        f.write(progress.model_dump_json())
+    os.replace(f"{path}.tmp", path)
+
+
+async def _commit_batch(
+    graph_id: str, extractions: list[list[str]], semaphore: asyncio.Semaphore
+) -> int:
+    """Merges one batch of extracted facts into the graph and stores it once. Returns the new version."""
+
+    async def merge(existing_knowledge: dict, facts: list[str]) -> Optional[dict]:
+        async with semaphore:
+            return await _merge(graph_id, existing_knowledge, facts)
+
+    for attempt in range(COMMIT_ATTEMPTS):
+        index = await asyncio.to_thread(graph_index.get_graph_index, graph_id, "ingest")
+        g, version = index.g, index.version
+        groups = await asyncio.to_thread(_group_facts, graph_id, index, extractions)
+        existing = [index.subgraph(neighborhood) for _, neighborhood in groups]
+        updated = await asyncio.gather(*(
+            merge(existing_knowledge, facts)
+            for existing_knowledge, (facts, _) in zip(existing, groups)
+        ))
+        for old_subgraph, new_subgraph, (facts, _) in zip(existing, updated, groups):
+            if new_subgraph is None:
+                logging.error("Leaving %d facts out of graph %s: their merge failed.", len(facts), graph_id)
+                continue
+            g = merge_subgraph(g, old_subgraph=old_subgraph, new_subgraph=new_subgraph)
+
+        try:
+            version = await asyncio.to_thread(
+                graph_store.store_knowledge_graph, g, graph_id, version, "ingest")
+        except PreconditionFailed:
+            logging.warning(
+                "Graph %s changed during ingestion (attempt %d of %d); merging the batch again.",
+                graph_id, attempt + 1, COMMIT_ATTEMPTS)
+            continue
+        await asyncio.to_thread(vector_index.get_vector_index, graph_id, g, version)
+        return version
+    raise RuntimeError(f"Could not commit a batch to graph {graph_id}: it kept changing.")
+
+
+async def ingest(
+    snippets: Iterable[str],
+    graph_id: str,
+    concurrency: int = 8,
+    batch_size: int = 50,
+    checkpoint_path: Optional[str] = None,
+    progress: Optional[IngestionProgress] = None,
+) -> IngestionProgress:
+    """
+    Ingests snippets into a knowledge graph.
+
+    Args:
+        snippets (Iterable[str]): The snippets, in the order they should be applied.
+        graph_id (str): The graph to update.
+        concurrency (int): Maximum number of model calls in flight.
+        batch_size (int): Number of snippets per graph commit.
+        checkpoint_path (Optional[str]): Where to record progress after each commit.
+            If a checkpoint for the same graph already exists there, snippets it
+            covers are skipped. A checkpoint for another graph is an error.
+        progress (Optional[IngestionProgress]): Updated in place as the run goes,
+            so that callers can report on it.
+
+    Returns:
+        IngestionProgress: The final progress.
+    """
+    progress = progress or IngestionProgress(graph_id=graph_id)
+    checkpoint = _load_checkpoint(checkpoint_path)
+    if checkpoint:
+        checkpoint = IngestionProgress.model_validate(checkpoint)
+        if checkpoint.graph_id != graph_id:
+            raise ValueError(
+                f"Checkpoint {checkpoint_path} is for graph {checkpoint.graph_id}, not {graph_id}.")
+        # Only the counters carry over; whether that run finished or failed doesn't.
+        for field in CHECKPOINT_COUNTERS:
+            setattr(progress, field, getattr(checkpoint, field))
+        progress.snippets_read = progress.snippets_committed
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def extract(snippet: str) -> list[str]:
+        async with semaphore:
+            return await _extract(graph_id, snippet)
+
+    async def finish(batch: tuple[str, ...], extraction: list[asyncio.Task]) -> None:
+        extractions = await asyncio.gather(*extraction)
+        progress.facts_extracted += sum(len(facts) for facts in extractions)
+        if any(extractions):
+            progress.graph_version = await _commit_batch(graph_id, extractions, semaphore)
+        progress.snippets_committed += len(batch)
+        progress.batches_committed += 1
+        _save_checkpoint(checkpoint_path, progress)
+
+    # Extraction of each batch starts while the previous batch is being merged.
+    pending = None
+    for batch in itertools.batched(itertools.islice(snippets, progress.snippets_committed, None), batch_size):
+        extraction = [asyncio.create_task(extract(snippet)) for snippet in batch]
+        progress.snippets_read += len(batch)
+        if pending:
+            try:
+                await finish(*pending)
+            except BaseException:
+                for task in extraction:
+                    task.cancel()
+                await asyncio.gather(*extraction, return_exceptions=True)
+                raise
+        pending = (batch, extraction)
+    if pending:
+        await finish(*pending)
+
+    progress.done = True
+    return progress
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest a JSONL corpus of snippets into a knowledge graph.")
+    parser.add_argument("corpus", help='JSONL file with one {"text": ...} snippet per line')
+    parser.add_argument("--graph-id", required=True, help="the graph (user ID) to update")
+    parser.add_argument("--concurrency", type=int, default=8, help="maximum model calls in flight")
+    parser.add_argument("--batch-size", type=int, default=50, help="snippets per graph commit")
+    parser.add_argument("--checkpoint", help="checkpoint file to resume from and record progress in")
+    args = parser.parse_args()
+
+    setup_environment()
+    progress = asyncio.run(ingest(
+        read_corpus(args.corpus),
+        graph_id=args.graph_id,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        checkpoint_path=args.checkpoint,
+    ))
+    print(progress.model_dump_json(indent=2))
+
+
+if __name__ == "__main__":
+    main()
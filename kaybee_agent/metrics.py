@@ -0,0 +1,217 @@
+"""In-process counters and histograms rendered in the Prometheus text format.
+
+Metrics are cheap to record (a dict lookup and a lock per observation) and can
+be switched off entirely with KAYBEE_METRICS_ENABLED=false, in which case every
+recording call returns immediately and the server does not expose /metrics.
+"""
+
+import abc
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("KAYBEE_METRICS_ENABLED", "true").lower() not in (
+    "0",
+    "false",
+    "no",
+)
+
+# Upper bounds (exclusive) on the number of entities in a tenant graph.
+TENANT_SIZE_BUCKETS = (
+    (100, "xs"),
+    (1_000, "s"),
+    (10_000, "m"),
+    (100_000, "l"),
+)
+
+# The version of the Prometheus text format that render() produces.
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+DEFAULT_SECONDS_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+DEFAULT_SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1_000, 5_000, 10_000)
+DEFAULT_BYTES_BUCKETS = tuple(2**i for i in range(10, 31, 2))  # 1 KiB .. 1 GiB
+
+_REGISTRY = []
+
+
+def tenant_size_bucket(num_entities: int) -> str:
+    """Returns a coarse size label for a tenant graph with `num_entities` entities."""
+    for upper, label in TENANT_SIZE_BUCKETS:
+        if num_entities < upper:
+            return label
+    return "xl"
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(abc.ABC):
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    @abc.abstractmethod
+    def _render_samples(self) -> list[str]:
+        """Returns the metric's sample lines. Called with the lock held."""
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        with self._lock:
+            lines.extend(self._render_samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """A monotonically increasing count."""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _render_samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    """A distribution of observations over fixed buckets."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple = (),
+        buckets: tuple = DEFAULT_SECONDS_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall-clock duration of the enclosed block, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for upper, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if upper == float("inf") else repr(float(upper))
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """Renders every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _REGISTRY) + "\n"
+
+
+STAGE_SECONDS = Histogram(
+    "kaybee_stage_duration_seconds",
+    "Time spent in each stage of a knowledge graph turn.",
+    labelnames=("stage", "size_bucket"),
+)
+GRAPH_FETCH_BYTES = Histogram(
+    "kaybee_graph_fetch_bytes",
+    "Size of knowledge graph blobs downloaded from storage.",
+    labelnames=("stage", "size_bucket"),
+    buckets=DEFAULT_BYTES_BUCKETS,
+)
+GRAPH_STORE_BYTES = Histogram(
+    "kaybee_graph_store_bytes",
+    "Size of knowledge graph blobs uploaded to storage.",
+    labelnames=("stage", "size_bucket"),
+    buckets=DEFAULT_BYTES_BUCKETS,
+)
+FUZZY_MATCH_CANDIDATES = Histogram(
+    "kaybee_fuzzy_match_candidates",
+    "Number of entities matched by fuzzy name lookup per retrieval.",
+    labelnames=("stage", "size_bucket"),
+    buckets=DEFAULT_SIZE_BUCKETS,
+)
+SEMANTIC_MATCH_CANDIDATES = Histogram(
+    "kaybee_semantic_match_candidates",
+    "Number of entities matched by vector search, and not by fuzzy name lookup, per retrieval.",
+    labelnames=("stage", "size_bucket"),
+    buckets=DEFAULT_SIZE_BUCKETS,
+)
+NEIGHBORHOOD_ENTITIES = Histogram(
+    "kaybee_neighborhood_entities",
+    "Number of entities in a retrieved neighborhood.",
+    labelnames=("stage", "size_bucket"),
+    buckets=DEFAULT_SIZE_BUCKETS,
+)
+NEIGHBORHOOD_RELATIONSHIPS = Histogram(
+    "kaybee_neighborhood_relationships",
+    "Number of relationships in a retrieved neighborhood.",
+    labelnames=("stage", "size_bucket"),
+    buckets=DEFAULT_SIZE_BUCKETS,
+)
+MERGE_DIFF_ENTITIES = Histogram(
+    "kaybee_merge_diff_entities",
+    "Number of entities removed plus added when a merged subgraph is stored.",
+    labelnames=("stage", "size_bucket"),
+    buckets=DEFAULT_SIZE_BUCKETS,
+)
+MERGE_DIFF_RELATIONSHIPS = Histogram(
+    "kaybee_merge_diff_relationships",
+    "Number of relationships removed plus added when a merged subgraph is stored.",
+    labelnames=("stage", "size_bucket"),
+    buckets=DEFAULT_SIZE_BUCKETS,
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "kaybee_event_loop_lag_seconds",
+    "Delay between when a periodic event loop callback was due and when it ran.",
+)
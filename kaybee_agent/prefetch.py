@@ -0,0 +1,79 @@
+"""Speculative loading of a tenant's graph and indexes into the process caches.
+
+The graph is otherwise fetched only when knowledge_research_agent calls its
+tool, after at least one model round trip. Starting the load when a session is
+created or a message arrives takes the fetch off the critical path: the tool
+then finds the graph cached, or joins the load still in flight (see
+graph_store.fetch_knowledge_graph).
+
+    KAYBEE_PREFETCH_ENABLED  whether to prefetch at all (default true)
+    KAYBEE_PREFETCH_WORKERS  threads loading graphs in the background (default 4)
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+
+from kaybee_agent import graph_index, metrics, vector_index
+
+ENABLED = os.environ.get("KAYBEE_PREFETCH_ENABLED", "true").lower() not in (
+    "0",
+    "false",
+    "no",
+)
+WORKERS = int(os.environ.get("KAYBEE_PREFETCH_WORKERS", "4"))
+
+PREFETCHES = metrics.Counter(
+    "kaybee_graph_prefetches_total",
+    "Graph prefetch requests by outcome (started, already_loading, failed).",
+    labelnames=("outcome",),
+)
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="kaybee-prefetch")
+_pending: dict[str, Future] = {}
+_pending_lock = threading.Lock()
+
+
+def _load(graph_id: str) -> None:
+    index = graph_index.get_graph_index(graph_id, stage="prefetch")
+    vector_index.get_vector_index(graph_id, index.g, index.version)
+
+
+def _finish(graph_id: str, future: Future) -> None:
+    with _pending_lock:
+        _pending.pop(graph_id, None)
+    if future.exception() is not None:
+        PREFETCHES.inc(outcome="failed")
+        logging.warning("Prefetch of graph %s failed: %r", graph_id, future.exception())
+
+
+def prefetch(graph_id: str) -> Optional[Future]:
+    """
+    Starts loading the latest version of a graph, its index and its vector
+    index in the background, unless that's already under way.
+
+    Returns:
+        Optional[Future]: The load, or None if prefetching is disabled.
+    """
+    if not ENABLED or not graph_id:
+        return None
+    with _pending_lock:
+        future = _pending.get(graph_id)
+        if future is not None:
+            PREFETCHES.inc(outcome="already_loading")
+            return future
+        future = _pending[graph_id] = _executor.submit(_load, graph_id)
+    PREFETCHES.inc(outcome="started")
+    future.add_done_callback(lambda f: _finish(graph_id, f))
+    return future
+
+
+def prefetch_graph(callback_context: CallbackContext) -> Optional[types.Content]:
+    """before_agent_callback that prefetches the graph of the invocation's user."""
+    prefetch(callback_context._invocation_context.user_id)
+    return None
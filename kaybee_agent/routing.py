@@ -0,0 +1,154 @@
+"""Per-call thinking budgets and model routing, from measured input features.
+
+Each agent's planner sets a fixed thinking budget. The router runs as a
+before_model_callback and, for every model call, measures the input:
+
+    snippet_chars          characters in the user's message
+    facts                  facts extracted this turn (merge only)
+    neighborhood_entities  entities in the retrieved neighborhood (merge only)
+
+It then applies the first rule, in the calling agent's list, whose conditions
+all hold. A rule can set the thinking budget, whether thoughts are included,
+and the model. When no rule matches, the planner's settings are kept. Every
+decision is logged and counted.
+
+The policy maps agent names to rule lists. It is read as JSON from
+KAYBEE_ROUTING_POLICY, or from the file named by KAYBEE_ROUTING_POLICY_FILE,
+and defaults to DEFAULT_POLICY. Conditions are "max_<feature>" (inclusive upper
+bound) or "min_<feature>" (inclusive lower bound), e.g.
+
+    {"merge_knowledge_agent": [
+        {"when": {"max_facts": 3, "max_neighborhood_entities": 10}, "thinking_budget": 256},
+        {"when": {"min_neighborhood_entities": 200}, "model": "gemini-2.5-pro"}
+    ]}
+"""
+
+import json
+import logging
+import os
+from typing import Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+from pydantic import BaseModel, TypeAdapter, field_validator
+
+from kaybee_agent import metrics
+
+ROUTING_DECISIONS = metrics.Counter(
+    "kaybee_routing_decisions_total",
+    "Model calls by agent and the routing rule applied to them (index, or 'default').",
+    labelnames=("agent", "rule"),
+)
+
+
+class RoutingRule(BaseModel):
+    """Settings for model calls whose input features satisfy `when`."""
+    when: dict[str, float] = {}
+    thinking_budget: Optional[int] = None
+    include_thoughts: Optional[bool] = None
+    model: Optional[str] = None
+
+    @field_validator("when")
+    @classmethod
+    def check_conditions(cls, when: dict[str, float]) -> dict[str, float]:
+        for condition in when:
+            if not condition.startswith(("max_", "min_")):
+                raise ValueError(f"Routing condition {condition!r} must start with 'max_' or 'min_'")
+        return when
+
+    def matches(self, features: dict[str, float]) -> bool:
+        for condition, bound in self.when.items():
+            kind, _, feature = condition.partition("_")
+            value = features.get(feature)
+            if value is None:
+                return False
+            if (value > bound) if kind == "max" else (value < bound):
+                return False
+        return True
+
+
+RoutingPolicy = TypeAdapter(dict[str, list[RoutingRule]])
+
+# Small inputs get a fraction of the planners' budgets; large transcripts and
+# big merges keep them.
+DEFAULT_POLICY = {
+    "knowledge_base_agent": [
+        {"when": {"max_snippet_chars": 200}, "thinking_budget": 256},
+    ],
+    "knowledge_updates_agent": [
+        {"when": {"max_snippet_chars": 300}, "thinking_budget": 256},
+        {"when": {"max_snippet_chars": 2000}, "thinking_budget": 512},
+    ],
+    "knowledge_research_agent": [
+        {"when": {"max_snippet_chars": 300}, "thinking_budget": 256},
+    ],
+    "merge_knowledge_agent": [
+        {"when": {"max_facts": 3, "max_neighborhood_entities": 10}, "thinking_budget": 256},
+        {"when": {"max_facts": 10, "max_neighborhood_entities": 50}, "thinking_budget": 512},
+    ],
+}
+
+
+def load_policy() -> dict[str, list[RoutingRule]]:
+    if os.environ.get("KAYBEE_ROUTING_POLICY"):
+        return RoutingPolicy.validate_json(os.environ["KAYBEE_ROUTING_POLICY"])
+    if os.environ.get("KAYBEE_ROUTING_POLICY_FILE"):
+        with open(os.environ["KAYBEE_ROUTING_POLICY_FILE"]) as f:
+            return RoutingPolicy.validate_json(f.read())
+    return RoutingPolicy.validate_python(DEFAULT_POLICY)
+
+
+POLICY = load_policy()
+
+
+def measure(callback_context: CallbackContext) -> dict[str, float]:
+    """Returns the input features of the model call about to be made."""
+    content = callback_context.user_content
+    snippet = "".join(part.text for part in content.parts if part.text) if content and content.parts else ""
+    features = {"snippet_chars": len(snippet)}
+    if callback_context.agent_name == "merge_knowledge_agent":
+        # Both are from this turn: merging runs after extraction and research.
+        updates = callback_context.state.get('knowledge_updates') or {}
+        ref = callback_context.state.get('existing_knowledge_ref') or {}
+        features["facts"] = len(updates.get('knowledge', []))
+        features["neighborhood_entities"] = len(ref.get('entity_ids', []))
+    return features
+
+
+def route_model_call(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    """before_model_callback that applies the routing policy to the model call."""
+    agent_name = callback_context.agent_name
+    rules = POLICY.get(agent_name)
+    if not rules:
+        return None
+
+    features = measure(callback_context)
+    rule_index = next((i for i, rule in enumerate(rules) if rule.matches(features)), None)
+    if rule_index is None:
+        ROUTING_DECISIONS.inc(agent=agent_name, rule="default")
+        logging.info("Routing %s with %s: planner defaults", agent_name, json.dumps(features))
+        return None
+
+    rule = rules[rule_index]
+    # The planner's ThinkingConfig is shared across calls; replace it, don't mutate it.
+    thinking_config = (
+        llm_request.config.thinking_config.model_copy()
+        if llm_request.config.thinking_config
+        else types.ThinkingConfig()
+    )
+    if rule.thinking_budget is not None:
+        thinking_config.thinking_budget = rule.thinking_budget
+    if rule.include_thoughts is not None:
+        thinking_config.include_thoughts = rule.include_thoughts
+    llm_request.config.thinking_config = thinking_config
+    if rule.model:
+        llm_request.model = rule.model
+
+    ROUTING_DECISIONS.inc(agent=agent_name, rule=str(rule_index))
+    logging.info(
+        "Routing %s with %s: rule %d, model %s, thinking budget %s, include thoughts %s",
+        agent_name, json.dumps(features), rule_index, llm_request.model,
+        thinking_config.thinking_budget, thinking_config.include_thoughts,
+    )
+    return None
@@ -2,6 +2,9 @@ from google.adk.agents import Agent
 from google.adk.planners import BuiltInPlanner
 from google.genai import types
 
+from kaybee_agent.admission import AdmittedGemini
+from kaybee_agent.routing import route_model_call
+
 from .tools import get_relevant_neighborhoods
 
 PROMPT = """
@@ -11,12 +14,12 @@ Your input is a conversation snippet, and your task is to retrieve any portions
 
 The tool that can help you do this is `get_relevant_neighborhoods`.
 
-The output of this agent will be the output of the `get_relevant_neighborhoods` tool.
+The tool keeps the knowledge it retrieves for the next step and returns only a summary of it (how many entities and relationships were retrieved). Once you have called it, briefly report that summary.
 """
 
 agent = Agent(
     name="knowledge_research_agent",
-    model="gemini-2.5-flash",
+    model=AdmittedGemini(model="gemini-2.5-flash", agent_name="knowledge_research_agent"),
     planner=BuiltInPlanner(
         thinking_config=types.ThinkingConfig(
             include_thoughts=True,
@@ -24,5 +27,6 @@ agent = Agent(
         )
     ),
     instruction=PROMPT,
-    tools=[get_relevant_neighborhoods]
+    tools=[get_relevant_neighborhoods],
+    before_model_callback=route_model_call,
 )
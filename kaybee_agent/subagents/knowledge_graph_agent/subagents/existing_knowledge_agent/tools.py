@@ -1,59 +1,38 @@
-import json
 import os
-import networkx as nx
-from dotenv import load_dotenv
-from typing import Optional
+import time
 
 from google.adk.tools import ToolContext
-from google.cloud import storage
-from thefuzz import fuzz
-
-load_dotenv()
-
-def _get_bucket():
-    storage_client = storage.Client()
-    bucket_name = os.environ.get("KNOWLEDGE_GRAPH_BUCKET")
-    if not bucket_name:
-        raise ValueError("KNOWLEDGE_GRAPH_BUCKET environment variable not set.")
-    return storage_client.get_bucket(bucket_name)
-
-
-def _fetch_knowledge_graph(graph_id: str) -> dict:
-    """Fetches the knowledge graph from the Google Cloud Storage bucket."""
-    bucket = _get_bucket()
-    blob = bucket.blob(f"{graph_id}.json")
-    if not blob.exists():
-        return {"entities": {}, "relationships": []}
-    else:
-        content = blob.download_as_text()
-        return json.loads(content)
-
-
-def _knowledge_graph_to_nx(g: dict) -> "nx.MultiDiGraph":
-    """Converts the knowledge graph dictionary to a NetworkX MultiDiGraph."""
-    mdg = nx.MultiDiGraph()
-    mdg.add_nodes_from((k, v) for k, v in g["entities"].items())
-    mdg.add_edges_from(
-        (
-            rel["source_entity_id"],
-            rel["target_entity_id"],
-            {"relationship": rel["relationship"]},
-        )
-        for rel in g.get("relationships", [])
-    )
-    return mdg
-
-
-def _find_entity_ids_by_name(
-    entity_name: str, g: dict, threshold: int = 80
-) -> list[str]:
-    """Finds an entity by its name or one of its synonyms using fuzzy string matching."""
-    return [
-        entity_id
-        for entity_id, entity_data in g["entities"].items()
-        for name in entity_data["entity_names"]
-        if fuzz.ratio(entity_name.lower(), name.lower()) > threshold
-    ]
+
+from kaybee_agent import cache, graph_index, graph_store, metrics, vector_index
+
+# Entities whose embeddings are this similar to a name are retrieved alongside
+# fuzzy name matches, up to SEMANTIC_TOP_K per name. Names sharing only a
+# common word ("Project Phoenix" and "Project Orion", "Engineering Team" and
+# "Marketing Team") score around 0.5, so the bar is above that. Semantic-only
+# matches are included as they are, without their neighborhoods.
+SEMANTIC_TOP_K = int(os.environ.get("KAYBEE_SEMANTIC_TOP_K", "3"))
+SEMANTIC_MIN_SCORE = float(os.environ.get("KAYBEE_SEMANTIC_MIN_SCORE", "0.6"))
+
+# Neighborhoods by (graph ID, graph version, sorted lowercased names). A new
+# graph version invalidates the graph's entries.
+NEIGHBORHOOD_CACHE = cache.TTLCache(
+    "neighborhood",
+    max_size=int(os.environ.get("KAYBEE_NEIGHBORHOOD_CACHE_SIZE", "1024")),
+    ttl=float(os.environ.get("KAYBEE_NEIGHBORHOOD_CACHE_TTL", "600")),
+)
+
+
+def expand_neighborhoods(index: "graph_index.GraphIndex", entity_id_sets: list[set[str]], hops: int = 2) -> list[set[str]]:
+    """
+    Args:
+        index (GraphIndex): The index of the knowledge graph.
+        entity_id_sets (list[set[str]]): Sets of entity IDs to expand.
+        hops (int): How many relationships away from the given entities to go.
+
+    Returns:
+        list[set[str]]: Each set of entity IDs, together with every entity within `hops` relationships of them.
+    """
+    return [index.expand(entity_ids, hops=hops) for entity_ids in entity_id_sets]
 
 def get_relevant_neighborhoods(entity_names: list[str], tool_context: ToolContext) -> dict:
     """
@@ -61,40 +40,63 @@ def get_relevant_neighborhoods(entity_names: list[str], tool_context: ToolContex
         entity_names (list[str]): A list of entity names, and any synonyms, that might be nodes in the existing knowledge graph.
 
     Returns:
-        dict: A relevant portion of the knowledge graph.
+        dict: A summary of the relevant portion of the knowledge graph, which is kept for the merge step.
     """
     graph_id = tool_context._invocation_context.user_id
-    g = _fetch_knowledge_graph(graph_id=graph_id)
-
-    relevant_entity_ids = set().union(*[
-        _find_entity_ids_by_name(entity_name, g)
-        for entity_name in entity_names
-    ])
-    mdg = _knowledge_graph_to_nx(g)
-
-    nbrs1 = {
-            nbr for entity_id in relevant_entity_ids
-            for nbr in mdg.to_undirected().neighbors(entity_id)
-    }
-    nbrs2 = {
-            nbr for entity_id in nbrs1
-            for nbr in mdg.to_undirected().neighbors(entity_id)
+    index = graph_index.get_graph_index(graph_id=graph_id, stage="retrieve")
+    # Matching is case-insensitive, so names differing only in case share an entry.
+    key = (graph_id, index.version, tuple(sorted({entity_name.lower() for entity_name in entity_names})))
+    cached = NEIGHBORHOOD_CACHE.get(key)
+    if cached is None:
+        NEIGHBORHOOD_CACHE.invalidate(lambda k: k[0] == graph_id and k[1] != index.version)
+        cached = _find_neighborhoods(graph_id, index, entity_names)
+        NEIGHBORHOOD_CACHE.put(key, cached)
+    neighborhood_entity_ids, summary = cached
+
+    # Only a reference goes into session state, and only a summary into the
+    # function response event; the merge step resolves the reference against
+    # the graph cache.
+    tool_context.state['existing_knowledge_ref'] = graph_store.make_ref(
+        index.version, neighborhood_entity_ids)
+
+    return summary
+
+def _find_neighborhoods(graph_id: str, index: "graph_index.GraphIndex", entity_names: list[str]) -> tuple[set[str], dict]:
+    """Returns the IDs of the entities in the names' neighborhoods, and a summary of the neighborhoods' subgraph."""
+    size_bucket = metrics.tenant_size_bucket(len(index.g["entities"]))
+
+    with metrics.STAGE_SECONDS.time(stage="retrieve_fuzzy_match", size_bucket=size_bucket):
+        relevant_entity_ids = set().union(*[
+            index.find_entity_ids_by_name(entity_name)
+            for entity_name in entity_names
+        ])
+    metrics.FUZZY_MATCH_CANDIDATES.observe(
+        len(relevant_entity_ids), stage="retrieve_fuzzy_match", size_bucket=size_bucket)
+
+    with metrics.STAGE_SECONDS.time(stage="retrieve_semantic_match", size_bucket=size_bucket):
+        vectors = vector_index.get_vector_index(graph_id, index.g, index.version)
+        semantic_entity_ids = {
+            entity_id
+            for matches in vectors.search(entity_names, k=SEMANTIC_TOP_K, min_score=SEMANTIC_MIN_SCORE)
+            for entity_id, _ in matches
+        } - relevant_entity_ids
+    metrics.SEMANTIC_MATCH_CANDIDATES.observe(
+        len(semantic_entity_ids), stage="retrieve_semantic_match", size_bucket=size_bucket)
+
+    neighborhood_start = time.perf_counter()
+    [neighborhood_entity_ids] = expand_neighborhoods(index, [relevant_entity_ids])
+    neighborhood_entity_ids |= semantic_entity_ids
+    neighborhoods = index.subgraph(neighborhood_entity_ids)
+
+    metrics.STAGE_SECONDS.observe(
+        time.perf_counter() - neighborhood_start, stage="retrieve_neighborhood", size_bucket=size_bucket)
+    metrics.NEIGHBORHOOD_ENTITIES.observe(
+        len(neighborhoods['entities']), stage="retrieve_neighborhood", size_bucket=size_bucket)
+    metrics.NEIGHBORHOOD_RELATIONSHIPS.observe(
+        len(neighborhoods['relationships']), stage="retrieve_neighborhood", size_bucket=size_bucket)
+
+    return neighborhood_entity_ids, {
+        'graph_version': index.version,
+        'entity_count': len(neighborhoods['entities']),
+        'relationship_count': len(neighborhoods['relationships']),
     }
-
-    subgraph = mdg.subgraph(relevant_entity_ids|nbrs1|nbrs2)
-    subgraph_json = nx.node_link_data(subgraph, edges="links")
-
-    neighborhoods = {
-        'entities': {node['entity_id']: node for node in subgraph_json['nodes']},
-        'relationships': [
-            {
-                'source_entity_id': link['source'],
-                'target_entity_id': link['target'],
-                'relationship': link['relationship']
-            } for link in subgraph_json['links']
-        ]
-    }
-
-    tool_context.state['existing_knowledge'] = neighborhoods
-
-    return neighborhoods
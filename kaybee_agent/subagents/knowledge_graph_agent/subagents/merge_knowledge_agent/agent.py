@@ -1,9 +1,15 @@
+import json
 from typing import Optional
 from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.readonly_context import ReadonlyContext
 from google.adk.agents import Agent
 from google.adk.planners import BuiltInPlanner
 from google.genai import types
 
+from kaybee_agent import graph_store
+from kaybee_agent.admission import AdmittedGemini
+from kaybee_agent.routing import route_model_call
+
 from .schemas import KnowledgeGraph
 from .tools import store_graph
 
@@ -27,6 +33,17 @@ The resulting knowledge graph must:
 You must output the final, merged graph as a `KnowledgeGraph` object.
 """
 
+def build_instruction(context: ReadonlyContext) -> str:
+    """Renders PROMPT, resolving the existing knowledge reference from the graph cache."""
+    existing_knowledge = graph_store.resolve_ref(
+        context._invocation_context.user_id,
+        context.state.get('existing_knowledge_ref'),
+    )
+    return PROMPT.format(
+        existing_knowledge=json.dumps(existing_knowledge),
+        knowledge_updates=json.dumps(context.state.get('knowledge_updates')),
+    )
+
 def check_for_updates(callback_context: CallbackContext) -> Optional[types.Content]:
     if not callback_context.state['knowledge_updates']['knowledge']:
         # Return Content to skip the agent's run
@@ -40,16 +57,16 @@ def check_for_updates(callback_context: CallbackContext) -> Optional[types.Conte
 
 agent = Agent(
     name="merge_knowledge_agent",
-    model="gemini-2.5-flash",
+    model=AdmittedGemini(model="gemini-2.5-flash", agent_name="merge_knowledge_agent"),
     planner=BuiltInPlanner(
         thinking_config=types.ThinkingConfig(
             include_thoughts=False,
             thinking_budget=1024,
         )
     ),
-    instruction=PROMPT,
+    instruction=build_instruction,
     output_schema=KnowledgeGraph,
-    output_key='updated_knowledge',
     before_agent_callback=check_for_updates,
+    before_model_callback=route_model_call,
     after_model_callback=store_graph
 )
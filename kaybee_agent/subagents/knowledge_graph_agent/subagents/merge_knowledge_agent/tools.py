@@ -1,41 +1,17 @@
 import json
-import os
-from dotenv import load_dotenv
+import logging
 from typing import Optional
 import uuid
 from floggit import flog
 
 from google.adk.agents.callback_context import CallbackContext
 from google.adk.models import LlmResponse
-from google.cloud import storage
+from google.api_core.exceptions import PreconditionFailed
 
-load_dotenv()
+from kaybee_agent import graph_store, metrics, vector_index
 
-def _get_bucket():
-    storage_client = storage.Client()
-    bucket_name = os.environ.get("KNOWLEDGE_GRAPH_BUCKET")
-    if not bucket_name:
-        raise ValueError("KNOWLEDGE_GRAPH_BUCKET environment variable not set.")
-    return storage_client.get_bucket(bucket_name)
-
-
-def _fetch_knowledge_graph(graph_id: str) -> dict:
-    """Fetches the knowledge graph from the Google Cloud Storage bucket."""
-    bucket = _get_bucket()
-    blob = bucket.blob(f"{graph_id}.json")
-    if not blob.exists():
-        return {"entities": {}, "relationships": []}
-    else:
-        content = blob.download_as_text()
-        return json.loads(content)
-
-def _store_knowledge_graph(knowledge_graph: dict, graph_id: str) -> None:
-    """Stores the knowledge graph in the Google Cloud Storage bucket."""
-    bucket = _get_bucket()
-    blob = bucket.blob(f"{graph_id}.json")
-    blob.upload_from_string(
-        json.dumps(knowledge_graph, indent=2), content_type="application/json"
-    )
+# Attempts at storing a merge when the graph changes underneath it.
+STORE_ATTEMPTS = 3
 
 
 def _reformat_graph(g: dict) -> dict:
@@ -68,46 +44,89 @@ def _reformat_graph(g: dict) -> dict:
 
     return g
 
+def merge_subgraph(g: dict, old_subgraph: dict, new_subgraph: dict) -> dict:
+    '''
+    Args:
+        g (dict): The full knowledge graph.
+        old_subgraph (dict): The portion of g that the merge started from.
+        new_subgraph (dict): The merged replacement for old_subgraph, as returned by _reformat_graph.
+
+    Returns:
+        dict: A new graph with old_subgraph excised from g and new_subgraph inserted. g is left untouched.'''
+
+    # Excise old_subgraph
+    excised_relationships = {
+            (r['source_entity_id'], r['target_entity_id'])
+            for r in old_subgraph['relationships']
+    }
+    merged = {
+        'entities': {
+            k: v
+            for k, v in g['entities'].items()
+            if k not in old_subgraph['entities']
+        },
+        'relationships': [
+            rel for rel in g['relationships']
+            if (rel['source_entity_id'], rel['target_entity_id']) not in excised_relationships
+        ],
+    }
+
+    # Insert new_subgraph
+    merged['entities'].update(new_subgraph['entities'])
+    merged['relationships'].extend(new_subgraph['relationships'])
+
+    return merged
+
 @flog
 def _record_graph_delta(graph_id: str, old_subgraph: dict, new_subgraph: dict):
     return
 
 def store_graph(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
     """
-    Stores the provided graph in the knowledge graph store.
-    This will overwrite the existing graph.
+    Merges the provided graph into the latest version of the knowledge graph
+    and stores it, merging again if the graph changes before the write.
     """
     if llm_response.partial:
         return
 
-    existing_knowledge_subgraph = callback_context.state['existing_knowledge']
+    graph_id = callback_context._invocation_context.user_id
+    existing_knowledge_subgraph = graph_store.resolve_ref(
+            graph_id, callback_context.state.get('existing_knowledge_ref'))
     updated_knowledge_subgraph = json.loads(llm_response.content.parts[-1].text)
     updated_knowledge_subgraph = _reformat_graph(updated_knowledge_subgraph)
 
-    graph_id = callback_context._invocation_context.user_id
-    full_knowledge_graph = _fetch_knowledge_graph(graph_id)
-
     _record_graph_delta(
             graph_id,
             old_subgraph=existing_knowledge_subgraph,
             new_subgraph=updated_knowledge_subgraph)
 
-    # Excise existing_knowledge_graph
-    full_knowledge_graph['entities'] = {
-            k: v
-            for k, v in full_knowledge_graph['entities'].items()
-            if k not in existing_knowledge_subgraph['entities']
-    }
-    full_knowledge_graph['relationships'] = [
-            rel for rel in full_knowledge_graph['relationships']
-            if (rel['source_entity_id'], rel['target_entity_id']) not in [
-                (r['source_entity_id'], r['target_entity_id'])
-                for r in existing_knowledge_subgraph['relationships']
-            ]
-    ]
-
-    # Insert updated_knowledge_graph
-    full_knowledge_graph['entities'].update(updated_knowledge_subgraph['entities'])
-    full_knowledge_graph['relationships'].extend(updated_knowledge_subgraph['relationships'])
-
-    _store_knowledge_graph(knowledge_graph=full_knowledge_graph, graph_id=graph_id)
+    # The write only succeeds if the graph is still at the version merged into;
+    # otherwise the subgraph is merged into the newer version and written again.
+    for attempt in range(STORE_ATTEMPTS):
+        full_knowledge_graph, version = graph_store.fetch_knowledge_graph(graph_id, stage="store")
+        full_knowledge_graph = merge_subgraph(
+                full_knowledge_graph,
+                old_subgraph=existing_knowledge_subgraph,
+                new_subgraph=updated_knowledge_subgraph)
+        try:
+            version = graph_store.store_knowledge_graph(
+                    knowledge_graph=full_knowledge_graph, graph_id=graph_id, if_version_match=version)
+        except PreconditionFailed:
+            logging.warning(
+                    "Graph %s changed while storing a merge (attempt %d of %d); merging again.",
+                    graph_id, attempt + 1, STORE_ATTEMPTS)
+            continue
+        break
+    else:
+        raise RuntimeError(f"Could not store a merge into graph {graph_id}: it kept changing.")
+
+    size_bucket = metrics.tenant_size_bucket(len(full_knowledge_graph['entities']))
+    metrics.MERGE_DIFF_ENTITIES.observe(
+        len(existing_knowledge_subgraph['entities']) + len(updated_knowledge_subgraph['entities']),
+        stage="store_merge", size_bucket=size_bucket)
+    metrics.MERGE_DIFF_RELATIONSHIPS.observe(
+        len(existing_knowledge_subgraph['relationships']) + len(updated_knowledge_subgraph['relationships']),
+        stage="store_merge", size_bucket=size_bucket)
+
+    # Only the entities this merge replaced are re-embedded.
+    vector_index.get_vector_index(graph_id, full_knowledge_graph, version)
@@ -1,8 +1,19 @@
+import hashlib
+import json
+import os
+from typing import Optional
+
 from google.adk.agents import Agent
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
 from google.adk.planners import BuiltInPlanner
 from google.genai import types
 
-from pydantic import BaseModel, Field
+from kaybee_agent import cache
+from kaybee_agent.admission import AdmittedGemini
+from kaybee_agent.routing import route_model_call
+
+from pydantic import BaseModel, Field, ValidationError
 
 class NewKnowledge(BaseModel):
     knowledge: list[str] = Field(
@@ -56,9 +67,53 @@ PROMPT = """
 ```
 """
 
+# Changes to the prompt or output schema change the version, and so miss
+# everything cached under the old one.
+PROMPT_VERSION = hashlib.sha256(
+    (PROMPT + json.dumps(NewKnowledge.model_json_schema(), sort_keys=True)).encode()
+).hexdigest()[:16]
+
+# Extracted knowledge (as NewKnowledge JSON) by (user ID, normalized snippet, prompt version).
+EXTRACTION_CACHE = cache.TTLCache(
+    "extraction",
+    max_size=int(os.environ.get("KAYBEE_EXTRACTION_CACHE_SIZE", "4096")),
+    ttl=float(os.environ.get("KAYBEE_EXTRACTION_CACHE_TTL", "3600")),
+)
+
+def _cache_key(callback_context: CallbackContext) -> Optional[tuple[str, str, str]]:
+    """Keys extraction on the user, so that users never see each other's snippets, and the current snippet."""
+    content = callback_context.user_content
+    if not content or not content.parts:
+        return None
+    snippet = " ".join(" ".join(part.text for part in content.parts if part.text).split())
+    return (callback_context._invocation_context.user_id, snippet, PROMPT_VERSION) if snippet else None
+
+def use_cached_knowledge(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    key = _cache_key(callback_context)
+    cached = EXTRACTION_CACHE.get(key) if key else None
+    if cached is None:
+        # Return None to call the model
+        return None
+    # Return a response to skip the model call; output_key is set from it as usual
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=cached)]))
+
+def cache_knowledge(callback_context: CallbackContext, llm_response: LlmResponse) -> Optional[LlmResponse]:
+    if llm_response.partial or not llm_response.content or not llm_response.content.parts:
+        return None
+    key = _cache_key(callback_context)
+    if not key:
+        return None
+    text = "".join(part.text for part in llm_response.content.parts if part.text and not part.thought)
+    try:
+        EXTRACTION_CACHE.put(key, NewKnowledge.model_validate_json(text).model_dump_json())
+    except ValidationError:
+        # Don't cache output the agent's own output_key handling would reject
+        pass
+    return None
+
 agent = Agent(
     name="knowledge_updates_agent",
-    model="gemini-2.5-flash",
+    model=AdmittedGemini(model="gemini-2.5-flash", agent_name="knowledge_updates_agent"),
     planner=BuiltInPlanner(
         thinking_config=types.ThinkingConfig(
             include_thoughts=False,
@@ -67,5 +122,7 @@ agent = Agent(
     ),
     instruction=PROMPT,
     output_schema=NewKnowledge,
-    output_key='knowledge_updates'
+    output_key='knowledge_updates',
+    before_model_callback=[use_cached_knowledge, route_model_call],
+    after_model_callback=cache_knowledge,
 )
@@ -0,0 +1,218 @@
+"""Per-graph vector index for semantic entity retrieval.
+
+Entities are embedded offline, without a model call, as signed hashed
+character n-gram and word vectors over their names, properties and
+relationship descriptions. Vectors are rows of a NumPy matrix, so all query
+names are scored against all entities with one matrix product.
+
+Each graph's index is updated incrementally: when it is asked for a newer
+version of the graph, only entities that changed since the indexed version
+are re-embedded. Graphs written by this process share unchanged entity dicts
+with the previous version, so that diff is mostly identity checks.
+"""
+
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from kaybee_agent import graph_store
+
+DIMENSIONS = int(os.environ.get("KAYBEE_EMBEDDING_DIMENSIONS", "1024"))
+# Total size of the cached embedding matrices. Least recently used graphs'
+# indexes are dropped beyond it (and rebuilt from scratch on next use).
+MAX_BYTES = int(os.environ.get("KAYBEE_VECTOR_INDEX_MAX_BYTES", str(256 * 2**20)))
+NGRAM_SIZES = (3, 4)
+
+_WORD = re.compile(r"\w+")
+
+
+def _features(text: str) -> list[str]:
+    text = " ".join(_WORD.findall(text.lower()))
+    padded = f" {text} "
+    return text.split() + [
+        padded[i:i + n]
+        for n in NGRAM_SIZES
+        for i in range(len(padded) - n + 1)
+    ]
+
+
+def embed(texts: list[str]) -> np.ndarray:
+    """Returns an L2-normalized (len(texts), DIMENSIONS) float32 matrix of text embeddings."""
+    rows, cols, signs = [], [], []
+    for row, text in enumerate(texts):
+        for feature in _features(text):
+            # crc32 rather than hash(), which is salted per process.
+            h = zlib.crc32(feature.encode())
+            rows.append(row)
+            cols.append(h % DIMENSIONS)
+            signs.append(1.0 if h & 0x80000000 else -1.0)
+
+    m = np.zeros((len(texts), DIMENSIONS), dtype=np.float32)
+    np.add.at(m, (rows, cols), signs)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return m / norms
+
+
+def _entity_texts(g: dict, entity_ids: list[str]) -> list[str]:
+    """Returns the text embedded for each entity: names, properties and relationships."""
+    wanted = set(entity_ids)
+    related = {entity_id: [] for entity_id in entity_ids}
+    for rel in g['relationships']:
+        source, target = rel['source_entity_id'], rel['target_entity_id']
+        for entity_id, other_id in ((source, target), (target, source)):
+            if entity_id in wanted:
+                other = g['entities'].get(other_id)
+                other_name = other['entity_names'][0] if other and other['entity_names'] else ""
+                related[entity_id].append(f"{rel['relationship']} {other_name}")
+
+    texts = []
+    for entity_id in entity_ids:
+        entity = g['entities'][entity_id]
+        properties = entity.get('properties') or {}
+        texts.append(" . ".join(
+            list(entity['entity_names'])
+            + [f"{key} {value}" for key, value in properties.items()]
+            + related[entity_id]
+        ))
+    return texts
+
+
+def _relationship_key(rel: dict) -> tuple[str, str, str]:
+    return rel['source_entity_id'], rel['target_entity_id'], rel['relationship']
+
+
+def _changed_entity_ids(old_g: dict, g: dict) -> set[str]:
+    """
+    Returns the IDs of the entities in `g` whose embedded text (see _entity_texts)
+    may differ from `old_g`'s: those that changed, both ends of every added or
+    removed relationship, and the neighbours of changed or removed entities,
+    whose text includes their names.
+    """
+    old_entities = old_g['entities']
+    changed = {
+        entity_id for entity_id, entity in g['entities'].items()
+        if old_entities.get(entity_id) is not entity and old_entities.get(entity_id) != entity
+    }
+    renamed = changed | (old_entities.keys() - g['entities'].keys())
+
+    touched = set(changed)
+    if g['relationships'] is not old_g['relationships']:
+        old_keys = set(map(_relationship_key, old_g['relationships']))
+        new_keys = set(map(_relationship_key, g['relationships']))
+        for source, target, _ in old_keys ^ new_keys:
+            touched.update((source, target))
+    if renamed:
+        for rel in g['relationships']:
+            source, target = rel['source_entity_id'], rel['target_entity_id']
+            if source in renamed:
+                touched.add(target)
+            if target in renamed:
+                touched.add(source)
+    return touched & g['entities'].keys()
+
+
+class EntityVectorIndex:
+    """Embeddings of every entity in one graph, as rows of a matrix."""
+
+    def __init__(self):
+        self.version = None
+        self.g = None
+        self.matrix = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        self.entity_ids: list = []
+        self.rows: dict[str, int] = {}
+        self._free_rows: list[int] = []
+        self._lock = threading.Lock()
+
+    def _upsert(self, g: dict, entity_ids: list[str]) -> None:
+        if not entity_ids:
+            return
+        vectors = embed(_entity_texts(g, entity_ids))
+        for entity_id, vector in zip(entity_ids, vectors):
+            row = self.rows.get(entity_id)
+            if row is None:
+                row = self._free_rows.pop() if self._free_rows else self._append_row()
+                self.rows[entity_id] = row
+                self.entity_ids[row] = entity_id
+            self.matrix[row] = vector
+
+    def _append_row(self) -> int:
+        row = len(self.entity_ids)
+        if row == len(self.matrix):
+            grown = np.zeros((max(16, 2 * len(self.matrix)), DIMENSIONS), dtype=np.float32)
+            grown[:row] = self.matrix
+            self.matrix = grown
+        self.entity_ids.append(None)
+        return row
+
+    def _remove(self, entity_ids) -> None:
+        for entity_id in entity_ids:
+            row = self.rows.pop(entity_id)
+            self.matrix[row] = 0.0
+            self.entity_ids[row] = None
+            self._free_rows.append(row)
+
+    def update(self, g: dict, version: int) -> None:
+        """Brings the index up to date with `g`, re-embedding only entities whose text changed."""
+        with self._lock:
+            if version == self.version:
+                return
+            old_g = self.g or graph_store.empty_graph()
+            self._remove([entity_id for entity_id in self.rows if entity_id not in g['entities']])
+            self._upsert(g, sorted(_changed_entity_ids(old_g, g)))
+            self.g, self.version = g, version
+
+    def search(self, queries: list[str], k: int = 3, min_score: float = 0.25) -> list[list[tuple[str, float]]]:
+        """
+        Args:
+            queries (list[str]): Texts to search for, e.g. entity names.
+            k (int): Maximum number of results per query.
+            min_score (float): Minimum cosine similarity of a result.
+
+        Returns:
+            list[list[tuple[str, float]]]: For each query, (entity ID, score) pairs, best first.
+        """
+        with self._lock:
+            matrix = self.matrix[:len(self.entity_ids)]
+            entity_ids = list(self.entity_ids)
+        if not queries or not len(matrix):
+            return [[] for _ in queries]
+
+        scores = embed(queries) @ matrix.T
+        k = min(k, len(entity_ids))
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        results = []
+        for query_scores, rows in zip(scores, top):
+            rows = sorted(rows, key=lambda row: -query_scores[row])
+            results.append([
+                (entity_ids[row], float(query_scores[row]))
+                for row in rows
+                if entity_ids[row] is not None and query_scores[row] >= min_score
+            ])
+        return results
+
+
+_indexes: "OrderedDict[str, EntityVectorIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_vector_index(graph_id: str, g: dict, version: int) -> EntityVectorIndex:
+    """Returns the graph's vector index, updated to `version` of the graph."""
+    with _indexes_lock:
+        index = _indexes.get(graph_id)
+        if index is None:
+            index = _indexes[graph_id] = EntityVectorIndex()
+        _indexes.move_to_end(graph_id)
+        while len(_indexes) > graph_store.CACHE_SIZE:
+            _indexes.popitem(last=False)
+    index.update(g, version)
+    with _indexes_lock:
+        # The index just used is kept even if it alone exceeds MAX_BYTES.
+        while len(_indexes) > 1 and sum(i.matrix.nbytes for i in _indexes.values()) > MAX_BYTES:
+            _indexes.popitem(last=False)
+    return index
@@ -12,27 +12,73 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
+import functools
+import logging
 import os
+import re
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
 
-from dotenv import load_dotenv
-from fastapi import FastAPI
-from google.adk.cli.fast_api import get_fast_api_app
-from pydantic import BaseModel
-from typing import Literal
-from google.cloud import logging as google_cloud_logging
-from tracing import CloudTraceLoggingSpanExporter
-from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider, export
+from startup import FAST_START, DeferredSpanExporter, phase
+
+with phase("import_adk"):
+    from dotenv import load_dotenv
+    from fastapi import FastAPI, HTTPException, Request
+    from fastapi.responses import JSONResponse, PlainTextResponse
+    from google.adk.cli.fast_api import get_fast_api_app
+    from pydantic import BaseModel
+    from typing import Literal
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace import TracerProvider, export
+
+from feedback import CloudLoggingSink, FeedbackBuffer, LocalSink
+from graph_api import router as graph_router
+from kaybee_agent import metrics
 
 
 # Load environment variables from .env file
 load_dotenv()
 
-from kaybee_agent.agent import setup_environment
-setup_environment()
+from kaybee_agent.environment import setup_environment
+
+with phase("setup_environment"):
+    setup_environment()
+
+
+@functools.cache
+def get_logger():
+    """Returns the Cloud Logging logger, creating the client on first use."""
+    from google.cloud import logging as google_cloud_logging
+
+    logging_client = google_cloud_logging.Client()
+    return logging_client.logger(__name__)
+
+
+def build_span_exporter():
+    """Builds the span exporter along with its Logging, Storage and Trace clients."""
+    from tracing import CloudTraceLoggingSpanExporter
 
-logging_client = google_cloud_logging.Client()
-logger = logging_client.logger(__name__)
+    return CloudTraceLoggingSpanExporter()
+
+
+span_exporter = DeferredSpanExporter(build_span_exporter)
+
+
+def warm_up() -> None:
+    """Creates API clients and imports the agent tree ahead of the first request."""
+    with phase("create_logging_client"):
+        get_logger()
+    with phase("create_span_exporter"):
+        span_exporter.exporter
+    with phase("import_agent"):
+        import kaybee_agent.agent  # noqa: F401
+
+
+if not FAST_START:
+    warm_up()
 
 AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -46,22 +92,117 @@ app_args = {"agents_dir": AGENT_DIR, "web": True}
 if session_uri:
     app_args["session_service_uri"] = session_uri
 else:
-    logger.log_text(
+    message = (
         "SESSION_SERVICE_URI not provided. Using in-memory session service instead. "
-        "All sessions will be lost when the server restarts.",
-        severity="WARNING",
+        "All sessions will be lost when the server restarts."
     )
+    if FAST_START:
+        # Cloud Run forwards stderr to Cloud Logging without a client round trip.
+        logging.warning(message)
+    else:
+        get_logger().log_text(message, severity="WARNING")
 
 provider = TracerProvider()
-processor = export.BatchSpanProcessor(CloudTraceLoggingSpanExporter())
+processor = export.BatchSpanProcessor(span_exporter)
 provider.add_span_processor(processor)
 trace.set_tracer_provider(provider)
 
 # Create FastAPI app with appropriate arguments
-app: FastAPI = get_fast_api_app(**app_args)
+with phase("create_app"):
+    app: FastAPI = get_fast_api_app(**app_args)
 
 app.title = "kaybee-agent"
 app.description = "API for interacting with the Agent"
+app.include_router(graph_router)
+
+EVENT_LOOP_LAG_INTERVAL = float(os.getenv("KAYBEE_EVENT_LOOP_LAG_INTERVAL", "0.5"))
+
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL) -> None:
+    """Records how late the event loop wakes a periodic sleeper.
+
+    Blocking work on the loop (e.g. synchronous tools and callbacks) delays
+    every other request; the lag is a direct measure of that queueing.
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        metrics.EVENT_LOOP_LAG_SECONDS.observe(
+            max(0.0, time.perf_counter() - start - interval)
+        )
+
+
+# Feedback is buffered in memory and written to Cloud Logging in batches.
+# KAYBEE_FEEDBACK_SINK=local keeps it in process instead, for local testing.
+feedback_buffer = FeedbackBuffer(
+    sink=(
+        LocalSink()
+        if os.getenv("KAYBEE_FEEDBACK_SINK") == "local"
+        else CloudLoggingSink(get_logger)
+    ),
+    max_size=int(os.getenv("KAYBEE_FEEDBACK_BUFFER_SIZE", "1000")),
+    batch_size=int(os.getenv("KAYBEE_FEEDBACK_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("KAYBEE_FEEDBACK_FLUSH_INTERVAL", "2.0")),
+    overflow=os.getenv("KAYBEE_FEEDBACK_OVERFLOW", "drop_oldest"),
+)
+
+WARM_UP_DELAY = float(os.getenv("KAYBEE_WARM_UP_DELAY", "0.1"))
+
+
+async def warm_up_in_background() -> None:
+    """Runs warm_up off the event loop, shortly after application startup."""
+    # The lifespan runs before uvicorn binds the port. The delay gives the bind
+    # a head start, but doesn't guarantee it happens first.
+    await asyncio.sleep(WARM_UP_DELAY)
+    with phase("warm_up"):
+        await asyncio.to_thread(warm_up)
+
+
+_adk_lifespan = app.router.lifespan_context
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Wraps the ADK lifespan to run the server's background tasks."""
+    async with _adk_lifespan(app) as state:
+        tasks = []
+        if metrics.ENABLED:
+            tasks.append(asyncio.create_task(monitor_event_loop_lag()))
+        await feedback_buffer.start()
+        if FAST_START:
+            tasks.append(asyncio.create_task(warm_up_in_background()))
+        try:
+            yield state
+        finally:
+            for task in tasks:
+                task.cancel()
+            await feedback_buffer.close()
+
+
+app.router.lifespan_context = lifespan
+
+
+if metrics.ENABLED:
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    def export_metrics() -> PlainTextResponse:
+        """Expose hot-path metrics in the Prometheus text format."""
+        return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+SESSION_CREATE_PATH = re.compile(r"^/apps/[^/]+/users/(?P<user_id>[^/]+)/sessions(/[^/]+)?$")
+
+
+@app.middleware("http")
+async def prefetch_on_session_create(request: Request, call_next):
+    """Start loading a user's knowledge graph as soon as they open a session."""
+    if request.method == "POST":
+        match = SESSION_CREATE_PATH.match(request.url.path)
+        if match:
+            from kaybee_agent import prefetch
+
+            prefetch.prefetch(match["user_id"])
+    return await call_next(request)
 
 
 class Feedback(BaseModel):
@@ -75,20 +216,99 @@ class Feedback(BaseModel):
     user_id: str = ""
 
 
-@app.post("/feedback")
-def collect_feedback(feedback: Feedback) -> dict[str, str]:
-    """Collect and log feedback.
+@app.post("/feedback", response_model=None)
+async def collect_feedback(feedback: Feedback) -> dict[str, str] | JSONResponse:
+    """Collect feedback and queue it for logging.
 
     Args:
         feedback: The feedback data to log
 
     Returns:
-        Success message
+        Success message, or a 503 if the feedback buffer is full
     """
-    logger.log_struct(feedback.model_dump(), severity="INFO")
+    if not feedback_buffer.submit(feedback.model_dump()):
+        return JSONResponse(
+            status_code=503,
+            content={"status": "busy"},
+            headers={"Retry-After": "1"},
+        )
     return {"status": "success"}
 
 
+# Ingestion jobs started on this instance, by job ID. Jobs only live as long as
+# the instance; use `python -m kaybee_agent.ingestion` for resumable runs.
+ingestion_jobs: dict = {}
+ingestion_tasks: set[asyncio.Task] = set()
+
+
+async def run_ingestion_job(progress, corpus_path: str, **kwargs) -> None:
+    """Runs an ingestion job, recording failures in its progress."""
+    from kaybee_agent import ingestion
+
+    try:
+        await ingestion.ingest(
+            ingestion.read_corpus(corpus_path),
+            progress.graph_id,
+            progress=progress,
+            **kwargs,
+        )
+    except Exception as e:
+        logging.exception("Ingestion into %s failed.", progress.graph_id)
+        progress.error = str(e)
+    finally:
+        os.remove(corpus_path)
+
+
+@app.post("/ingest/{user_id}", status_code=202)
+async def start_ingestion(
+    user_id: str, request: Request, concurrency: int = 8, batch_size: int = 50
+) -> dict[str, str]:
+    """Start ingesting a JSONL corpus of snippets into a user's knowledge graph.
+
+    Args:
+        user_id: The user whose knowledge graph is updated
+        request: The request, whose body is the corpus, one {"text": ...} per line
+        concurrency: Maximum number of model calls in flight
+        batch_size: Number of snippets per graph commit
+
+    Returns:
+        The ID of the ingestion job
+    """
+    from kaybee_agent import ingestion
+
+    job_id = str(uuid.uuid4())
+    corpus_path = os.path.join(tempfile.gettempdir(), f"ingest-{job_id}.jsonl")
+    with open(corpus_path, "wb") as f:
+        async for chunk in request.stream():
+            f.write(chunk)
+
+    progress = ingestion.IngestionProgress(graph_id=user_id)
+    ingestion_jobs[job_id] = progress
+    task = asyncio.create_task(
+        run_ingestion_job(
+            progress, corpus_path, concurrency=concurrency, batch_size=batch_size
+        )
+    )
+    ingestion_tasks.add(task)
+    task.add_done_callback(ingestion_tasks.discard)
+    return {"job_id": job_id}
+
+
+@app.get("/ingest/{job_id}")
+def get_ingestion(job_id: str) -> dict:
+    """Report the progress of an ingestion job.
+
+    Args:
+        job_id: The ID returned when the job was started
+
+    Returns:
+        The job's progress
+    """
+    if job_id not in ingestion_jobs:
+        raise HTTPException(status_code=404, detail="Unknown ingestion job")
+    return ingestion_jobs[job_id].model_dump()
+
+
 # Main execution
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,75 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import time
+from collections.abc import Callable, Sequence
+from contextlib import contextmanager
+
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+# In fast start mode the server doesn't create API clients or import the agent
+# tree before it binds its port. It warms them up in the background instead.
+FAST_START = os.getenv("KAYBEE_FAST_START", "false").lower() in ("1", "true", "yes")
+
+# Seconds spent in each named phase of server startup, in order.
+STARTUP_TIMINGS: dict[str, float] = {}
+
+
+@contextmanager
+def phase(name: str):
+    """Record the wall-clock duration of a startup phase in STARTUP_TIMINGS."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS[name] = time.perf_counter() - start
+
+
+class DeferredSpanExporter(SpanExporter):
+    """
+    A span exporter that builds the wrapped exporter, and with it any API clients,
+    the first time it is used rather than at import time.
+    """
+
+    def __init__(self, factory: Callable[[], SpanExporter]) -> None:
+        """
+        :param factory: Builds the exporter that spans are actually sent to
+        """
+        self._factory = factory
+        self._exporter: SpanExporter | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def exporter(self) -> SpanExporter:
+        """The wrapped exporter, built on first access."""
+        if self._exporter is None:
+            with self._lock:
+                if self._exporter is None:
+                    self._exporter = self._factory()
+        return self._exporter
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        return self.exporter.export(spans)
+
+    def shutdown(self) -> None:
+        if self._exporter is not None:
+            self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        if self._exporter is None:
+            return True
+        return self._exporter.force_flush(timeout_millis)
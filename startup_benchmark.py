@@ -0,0 +1,106 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures server cold start, with and without KAYBEE_FAST_START.
+
+Each run imports `server` in a fresh interpreter with `-X importtime`, then
+reports the time until the app object exists (what blocks binding the port),
+the server's own startup phases, and import cost grouped by top-level package.
+
+    uv run python startup_benchmark.py --runs 5 --top 15
+"""
+
+import argparse
+import collections
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import server
+import startup
+app_ready = time.perf_counter() - start
+warm_up = None
+if startup.FAST_START:
+    start = time.perf_counter()
+    server.warm_up()
+    warm_up = time.perf_counter() - start
+print(json.dumps({
+    "app_ready": app_ready,
+    "deferred_warm_up": warm_up,
+    "phases": startup.STARTUP_TIMINGS,
+}))
+"""
+
+
+def run_once(fast_start: bool) -> tuple[dict, dict[str, float]]:
+    """Returns the child's timings and its self import time (s) per top-level package."""
+    env = os.environ | {"KAYBEE_FAST_START": "true" if fast_start else "false"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=True,
+    )
+
+    imports = collections.Counter()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        imports[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return json.loads(result.stdout.strip().splitlines()[-1]), imports
+
+
+def report(fast_start: bool, runs: int, top: int) -> None:
+    samples = [run_once(fast_start) for _ in range(runs)]
+    timings = [timing for timing, _ in samples]
+
+    print(f"\n== KAYBEE_FAST_START={fast_start} ({runs} runs, medians) ==")
+    print(f"{'app ready':<32}{statistics.median(t['app_ready'] for t in timings):>10.3f}s")
+    if fast_start:
+        warm_up = statistics.median(t["deferred_warm_up"] for t in timings)
+        print(f"{'deferred warm-up':<32}{warm_up:>10.3f}s")
+
+    print("\nstartup phases:")
+    for name in timings[0]["phases"]:
+        value = statistics.median(t["phases"].get(name, 0.0) for t in timings)
+        print(f"  {name:<30}{value:>10.3f}s")
+
+    print(f"\nimport time by top-level package (top {top}, including warm-up):")
+    totals = collections.Counter()
+    for _, imports in samples:
+        totals.update(imports)
+    for name, value in totals.most_common(top):
+        print(f"  {name:<30}{value / runs:>10.3f}s")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="interpreters per mode")
+    parser.add_argument("--top", type=int, default=10, help="packages to list")
+    args = parser.parse_args()
+
+    for fast_start in (False, True):
+        report(fast_start, args.runs, args.top)
+
+
+if __name__ == "__main__":
+    main()
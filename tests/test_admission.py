@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import errors, types
+
+from kaybee_agent import admission
+from kaybee_agent.admission import AdmissionController, RetryBudget
+
+
+def rate_limited() -> errors.ClientError:
+    return errors.ClientError(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "message": "Slow down"}})
+
+
+class StubModel:
+    """Streams one response per call, after failing the first `failures` calls with a 429."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = 0
+
+    async def generate(self, text: str = "ok"):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if self.calls <= self.failures:
+            raise rate_limited()
+        yield text
+
+
+async def collect(controller: AdmissionController, model: StubModel, agent: str = "agent", tenant: str = "") -> list:
+    return [item async for item in controller.stream(model.generate, agent=agent, tenant=tenant)]
+
+
+def test_retries_rate_limited_calls():
+    controller = AdmissionController(base_backoff=0.001)
+    model = StubModel(failures=2)
+
+    assert asyncio.run(collect(controller, model)) == ["ok"]
+    assert model.calls == 3
+    assert controller.in_flight == 0
+
+
+def test_gives_up_when_retry_budget_is_exhausted():
+    controller = AdmissionController(base_backoff=0.001, retry_budget=RetryBudget(ratio=0.0, min_per_second=0.1))
+    model = StubModel(failures=10)
+
+    with pytest.raises(errors.ClientError):
+        asyncio.run(collect(controller, model))
+    # The budget held one retry.
+    assert model.calls == 2
+    assert controller.in_flight == 0
+
+
+def test_does_not_retry_other_errors():
+    controller = AdmissionController(base_backoff=0.001)
+
+    async def fail():
+        raise ValueError("bad request")
+        yield
+
+    with pytest.raises(ValueError):
+        asyncio.run(collect(controller, type("Failing", (), {"generate": staticmethod(fail)})()))
+    assert controller.in_flight == 0
+
+
+def test_nested_calls_do_not_deadlock():
+    # Like an agent that transfers to a sub-agent while handling its model's
+    # response: every parent call makes a child call before it finishes.
+    controller = AdmissionController(max_concurrency=2)
+    model = StubModel()
+
+    async def parent(tenant: str) -> list:
+        results = []
+        async for item in controller.stream(model.generate, agent="root", tenant=tenant):
+            results.append(item)
+            results.extend(await collect(controller, model, agent="child", tenant=tenant))
+        return results
+
+    async def main():
+        return await asyncio.wait_for(asyncio.gather(*(parent(f"t{i}") for i in range(4))), timeout=5)
+
+    assert asyncio.run(main()) == [["ok", "ok"]] * 4
+    assert controller.in_flight == 0
+
+
+def test_queues_fairly_across_tenants():
+    controller = AdmissionController(max_concurrency=1)
+    order = []
+
+    async def call(tenant: str):
+        async with controller.admit("agent", tenant):
+            order.append(tenant)
+            await asyncio.sleep(0.001)
+
+    async def main():
+        await asyncio.gather(*[call("a") for _ in range(3)], *[call("b") for _ in range(2)])
+
+    asyncio.run(main())
+    assert order == ["a", "a", "b", "a", "b"]
+
+
+def test_limits_concurrency_per_agent():
+    controller = AdmissionController(max_concurrency=8, agent_concurrency={"merge": 2})
+    peak = 0
+
+    async def call():
+        nonlocal peak
+        async with controller.admit("merge"):
+            peak = max(peak, controller.agent_in_flight["merge"])
+            await asyncio.sleep(0.001)
+
+    async def main():
+        await asyncio.gather(*(call() for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
+    assert controller.in_flight == 0
+
+
+def test_call_blocked_by_its_agent_limit_does_not_hold_up_other_agents():
+    controller = AdmissionController(max_concurrency=8, agent_concurrency={"merge": 1})
+    admitted = []
+
+    async def call(agent: str, release: asyncio.Event):
+        async with controller.admit(agent):
+            admitted.append(agent)
+            await release.wait()
+
+    async def main():
+        release, done = asyncio.Event(), asyncio.Event()
+        done.set()
+        merges = [asyncio.create_task(call("merge", release)) for _ in range(2)]
+        await asyncio.sleep(0)
+        # The second merge call waits for the first; a root call shouldn't.
+        await asyncio.wait_for(call("root", done), timeout=1)
+        release.set()
+        await asyncio.gather(*merges)
+
+    asyncio.run(main())
+    assert admitted == ["merge", "root", "merge"]
+    assert controller.in_flight == 0
+
+
+def test_admitted_gemini_retries_through_the_controller(monkeypatch):
+    model = StubModel(failures=1)
+
+    async def generate_content_async(self, llm_request, stream=False):
+        async for text in model.generate():
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+    monkeypatch.setattr(admission.Gemini, "generate_content_async", generate_content_async)
+    monkeypatch.setattr(admission, "controller", AdmissionController(base_backoff=0.001))
+    gemini = admission.AdmittedGemini(model="gemini-2.5-flash", agent_name="knowledge_updates_agent")
+
+    async def main():
+        return [response async for response in gemini.generate_content_async(LlmRequest())]
+
+    [response] = asyncio.run(main())
+    assert response.content.parts[0].text == "ok"
+    assert model.calls == 2
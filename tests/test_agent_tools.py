@@ -0,0 +1,79 @@
+"""Tests of the agents' tools and callbacks.
+
+Importing the agent tree sets up Cloud Logging (through floggit), so these
+need Google Cloud credentials and are skipped without them.
+"""
+
+from types import SimpleNamespace
+
+import google.auth
+import pytest
+from google.auth.exceptions import DefaultCredentialsError
+
+try:
+    google.auth.default()
+except DefaultCredentialsError:
+    pytest.skip("needs Google Cloud credentials", allow_module_level=True)
+
+from google.genai import types  # noqa: E402
+
+from kaybee_agent import cache  # noqa: E402
+from kaybee_agent.subagents.knowledge_graph_agent.subagents.existing_knowledge_agent import tools  # noqa: E402
+from kaybee_agent.subagents.knowledge_graph_agent.subagents.merge_knowledge_agent.tools import merge_subgraph  # noqa: E402
+from kaybee_agent.subagents.knowledge_graph_agent.subagents.new_knowledge_agent.agent import _cache_key  # noqa: E402
+
+
+def callback_context(user_id: str, text: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        user_content=types.Content(role="user", parts=[types.Part(text=text)]),
+        _invocation_context=SimpleNamespace(user_id=user_id),
+    )
+
+
+def test_extraction_key_is_the_user_and_normalized_snippet():
+    assert _cache_key(callback_context("u1", "Sam  left\nthe team.")) == _cache_key(callback_context("u1", "Sam left the team."))
+    assert _cache_key(callback_context("u1", "Sam left the team.")) != _cache_key(callback_context("u2", "Sam left the team."))
+
+
+def test_neighborhoods_are_invalidated_when_the_graph_version_changes(monkeypatch):
+    versions = iter([1, 1, 2])
+    found = []
+
+    def get_graph_index(graph_id, stage):
+        return SimpleNamespace(version=next(versions))
+
+    def find_neighborhoods(graph_id, index, entity_names):
+        found.append(index.version)
+        return {"e1"}, {"graph_version": index.version}
+
+    monkeypatch.setattr(tools.graph_index, "get_graph_index", get_graph_index)
+    monkeypatch.setattr(tools, "_find_neighborhoods", find_neighborhoods)
+    monkeypatch.setattr(tools, "NEIGHBORHOOD_CACHE", cache.TTLCache("neighborhood", max_size=10, ttl=60))
+    tool_context = SimpleNamespace(_invocation_context=SimpleNamespace(user_id="g"), state={})
+
+    for names in (["Sam", "Orion"], ["orion", "sam"], ["Sam", "Orion"]):
+        tools.get_relevant_neighborhoods(names, tool_context)
+
+    assert found == [1, 2]
+    assert [key[1] for key in tools.NEIGHBORHOOD_CACHE._entries] == [2]
+
+
+def test_merge_subgraph_replaces_the_old_subgraph():
+    g = {
+        "entities": {"a": {"entity_id": "a"}, "b": {"entity_id": "b"}, "c": {"entity_id": "c"}},
+        "relationships": [
+            {"source_entity_id": "a", "target_entity_id": "b"},
+            {"source_entity_id": "b", "target_entity_id": "c"},
+        ],
+    }
+    old_subgraph = {"entities": {"a": g["entities"]["a"], "b": g["entities"]["b"]}, "relationships": [g["relationships"][0]]}
+    new_subgraph = {
+        "entities": {"ab": {"entity_id": "ab"}},
+        "relationships": [{"source_entity_id": "ab", "target_entity_id": "c"}],
+    }
+
+    merged = merge_subgraph(g, old_subgraph=old_subgraph, new_subgraph=new_subgraph)
+
+    assert set(merged["entities"]) == {"ab", "c"}
+    assert merged["relationships"] == [g["relationships"][1], new_subgraph["relationships"][0]]
+    assert set(g["entities"]) == {"a", "b", "c"}
@@ -0,0 +1,24 @@
+from kaybee_agent import cache
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now)
+    c = cache.TTLCache("test", max_size=10, ttl=60)
+    c.put("key", "value")
+
+    now += 59
+    assert c.get("key") == "value"
+    now += 2
+    assert c.get("key") is None
+    assert len(c) == 0
+
+
+def test_evicts_the_least_recently_used_entry():
+    c = cache.TTLCache("test", max_size=2, ttl=60)
+    c.put("a", 1)
+    c.put("b", 2)
+    c.get("a")
+    c.put("c", 3)
+
+    assert (c.get("a"), c.get("b"), c.get("c")) == (1, None, 3)
@@ -0,0 +1,50 @@
+from kaybee_agent import compaction, graph_index
+
+
+def entity(entity_id: str, *names: str) -> dict:
+    return {"entity_id": entity_id, "entity_names": list(names), "properties": {}}
+
+
+def compact(*entities: dict) -> compaction.CompactionReport:
+    g = {"entities": {e["entity_id"]: e for e in entities}, "relationships": []}
+    _, report = compaction.compact_graph(graph_index.GraphIndex(g, 1), "graph")
+    return report
+
+
+def test_merges_entities_sharing_a_normalized_name():
+    report = compact(entity("a", "Sam Smith"), entity("b", "sam  smith."))
+    assert report.merged_entities == 1
+    assert report.clusters == [{"a": ["Sam Smith"], "b": ["sam  smith."]}]
+
+
+def test_does_not_merge_names_differing_in_numbers():
+    report = compact(
+        entity("a", "Quarterly Report 2023 Q1", "Quarterly Report"),
+        entity("b", "Quarterly Report 2023 Q2", "Quarterly Report"),
+    )
+    assert report.merged_entities == 0
+    assert report.clusters == []
+
+
+def test_one_shared_alias_is_not_enough():
+    report = compact(entity("a", "Sam Smith", "Sam"), entity("b", "Sam Jones", "Sam"))
+    assert report.merged_entities == 0
+
+
+def test_merges_typos_in_the_last_word():
+    report = compact(entity("a", "Project Orion", "Orion"), entity("b", "Project Orin", "Orion"))
+    assert report.merged_entities == 1
+    assert report.clusters == [{"a": ["Project Orion", "Orion"], "b": ["Project Orin", "Orion"]}]
+
+
+def test_one_fuzzy_match_is_not_enough():
+    report = compact(entity("a", "International Business Machines"), entity("b", "International Business Machine"))
+    assert report.merged_entities == 0
+
+
+def test_merges_entities_with_several_fuzzy_matching_names():
+    report = compact(
+        entity("a", "International Business Machines", "Big Blue Corporation Inc"),
+        entity("b", "Internatonal Business Machines", "Big Bleu Corporation Inc"),
+    )
+    assert report.merged_entities == 1
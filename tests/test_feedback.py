@@ -0,0 +1,93 @@
+import asyncio
+
+from feedback import FeedbackBuffer, LocalSink
+
+
+def entry(i: int) -> dict:
+    return {"score": i, "invocation_id": str(i)}
+
+
+def test_flushes_when_the_batch_size_is_reached():
+    sink = LocalSink()
+    buffer = FeedbackBuffer(sink, batch_size=3, flush_interval=60)
+
+    async def main():
+        await buffer.start()
+        for i in range(3):
+            buffer.submit(entry(i))
+        for _ in range(100):
+            if sink.entries:
+                break
+            await asyncio.sleep(0.01)
+        await buffer.close()
+
+    asyncio.run(main())
+    assert sink.entries == [entry(0), entry(1), entry(2)]
+    assert sink.batches == 1
+
+
+def test_flushes_after_the_interval():
+    sink = LocalSink()
+    buffer = FeedbackBuffer(sink, batch_size=100, flush_interval=0.05)
+
+    async def main():
+        await buffer.start()
+        buffer.submit(entry(0))
+        await asyncio.sleep(0.2)
+        flushed = list(sink.entries)
+        await buffer.close()
+        return flushed
+
+    assert asyncio.run(main()) == [entry(0)]
+
+
+def test_drop_oldest_discards_the_oldest_entry_when_full():
+    sink = LocalSink()
+    buffer = FeedbackBuffer(sink, max_size=2, overflow="drop_oldest")
+
+    assert all(buffer.submit(entry(i)) for i in range(3))
+    asyncio.run(buffer.close())
+    assert sink.entries == [entry(1), entry(2)]
+
+
+def test_reject_refuses_new_entries_when_full():
+    sink = LocalSink()
+    buffer = FeedbackBuffer(sink, max_size=2, overflow="reject")
+
+    assert [buffer.submit(entry(i)) for i in range(3)] == [True, True, False]
+    asyncio.run(buffer.close())
+    assert sink.entries == [entry(0), entry(1)]
+
+
+def test_close_flushes_pending_entries_in_batches():
+    sink = LocalSink()
+    buffer = FeedbackBuffer(sink, batch_size=2, flush_interval=60)
+
+    async def main():
+        await buffer.start()
+        buffer.submit(entry(0))
+        await buffer.close()
+        buffer.submit(entry(1))
+        buffer.submit(entry(2))
+        buffer.submit(entry(3))
+        await buffer.close()
+
+    asyncio.run(main())
+    assert sink.entries == [entry(i) for i in range(4)]
+    assert sink.batches == 3
+
+
+def test_collect_feedback_returns_503_when_the_buffer_is_full(monkeypatch):
+    monkeypatch.setenv("KAYBEE_FAST_START", "true")
+    monkeypatch.setenv("KAYBEE_FEEDBACK_SINK", "local")
+    # The server installs a tracer provider that exports to Cloud Trace.
+    monkeypatch.setenv("OTEL_SDK_DISABLED", "true")
+    import server
+
+    monkeypatch.setattr(server, "feedback_buffer", FeedbackBuffer(LocalSink(), max_size=1, overflow="reject"))
+    feedback = server.Feedback(score=5, invocation_id="invocation")
+
+    assert asyncio.run(server.collect_feedback(feedback)) == {"status": "success"}
+    response = asyncio.run(server.collect_feedback(feedback))
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
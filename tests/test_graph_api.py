@@ -0,0 +1,102 @@
+import json
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import graph_api
+from kaybee_agent import graph_index, graph_store
+
+
+def entity(entity_id: str, *names: str) -> dict:
+    return {"entity_id": entity_id, "entity_names": list(names), "properties": {}}
+
+
+GRAPH = {
+    "entities": {e["entity_id"]: e for e in [entity("a", "Sam"), entity("b", "Orion"), entity("c", "Datacenter A")]},
+    "relationships": [
+        {"source_entity_id": "a", "target_entity_id": "b", "relationship": "leads"},
+        {"source_entity_id": "b", "target_entity_id": "c", "relationship": "runs in"},
+    ],
+}
+
+
+class FakeBucket:
+    def __init__(self, graphs: dict):
+        self.graphs = graphs
+
+    def get_blob(self, name):
+        if name.removesuffix(".json") not in self.graphs:
+            return None
+        g, version = self.graphs[name.removesuffix(".json")]
+        return SimpleNamespace(generation=version, download_as_bytes=lambda: json.dumps(g).encode())
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    """The graphs in storage, by ID, as (graph, version)."""
+    graphs = {"g": (GRAPH, 3)}
+    monkeypatch.setattr(graph_store, "_get_bucket", lambda: FakeBucket(graphs))
+    monkeypatch.setattr(graph_store, "_cache", OrderedDict())
+    monkeypatch.setattr(graph_store, "_latest", {})
+    monkeypatch.setattr(graph_index, "_indexes", OrderedDict())
+    monkeypatch.setattr(graph_api, "MAX_STALENESS", 0.0)
+    return graphs
+
+
+@pytest.fixture
+def client() -> TestClient:
+    app = FastAPI()
+    app.include_router(graph_api.router)
+    return TestClient(app)
+
+
+def test_responses_carry_the_version_as_etag(stored, client):
+    response = client.get("/graphs/g/entities/a")
+    assert response.status_code == 200
+    assert response.headers["ETag"] == '"3"'
+    assert response.json()["relationships"] == [GRAPH["relationships"][0]]
+
+
+def test_if_none_match_gets_304_until_the_graph_changes(stored, client):
+    assert client.get("/graphs/g/aliases", params={"name": "sam"}, headers={"If-None-Match": '"3"'}).status_code == 304
+    assert client.get("/graphs/g/aliases", params={"name": "sam"}, headers={"If-None-Match": "*"}).status_code == 304
+
+    stored["g"] = (GRAPH, 4)
+    response = client.get("/graphs/g/aliases", params={"name": "sam"}, headers={"If-None-Match": '"3"'})
+    assert response.status_code == 200
+    assert response.json() == {"entities": [GRAPH["entities"]["a"]]}
+
+
+def test_unknown_graphs_are_404(stored, client):
+    assert client.get("/graphs/missing/entities/a").status_code == 404
+    assert client.get("/graphs/missing/export").status_code == 404
+    assert client.get("/graphs/missing/export", headers={"If-None-Match": "*"}).status_code == 404
+
+
+def test_export_follows_page_tokens(stored, client):
+    lines, page_token = [], None
+    while True:
+        response = client.get("/graphs/g/export", params={"page_size": 2, "page_token": page_token})
+        assert response.status_code == 200
+        lines += response.text.splitlines()
+        page_token = response.headers.get("X-Next-Page-Token")
+        if not page_token:
+            break
+
+    assert lines == [
+        '{"entity": %s}' % json.dumps(GRAPH["entities"]["a"]),
+        '{"entity": %s}' % json.dumps(GRAPH["entities"]["b"]),
+        '{"relationship": %s}' % json.dumps(GRAPH["relationships"][0]),
+        '{"relationship": %s}' % json.dumps(GRAPH["relationships"][1]),
+        '{"entity": %s}' % json.dumps(GRAPH["entities"]["c"]),
+    ]
+
+
+def test_export_is_410_once_the_version_is_evicted(stored, client):
+    page_token = client.get("/graphs/g/export", params={"page_size": 2}).headers["X-Next-Page-Token"]
+    graph_store._cache.clear()
+
+    assert client.get("/graphs/g/export", params={"page_token": page_token}).status_code == 410
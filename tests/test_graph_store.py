@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict
+
+from kaybee_agent import graph_store
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket"):
+        self.bucket = bucket
+        self.generation = bucket.generation
+
+    def upload_from_string(self, content, content_type=None, if_generation_match=None):
+        self.bucket.generation += 1
+        self.generation = self.bucket.generation
+
+
+class FakeBucket:
+    generation = 1
+
+    def blob(self, name):
+        return FakeBlob(self)
+
+
+def test_fetch_after_a_write_does_not_join_an_older_fetch(monkeypatch):
+    bucket = FakeBucket()
+    monkeypatch.setattr(graph_store, "_get_bucket", lambda: bucket)
+    started, release = threading.Event(), threading.Event()
+
+    def fetch_latest(graph_id, stage):
+        # The first fetch reads the version before the write, then stalls.
+        version = bucket.generation
+        started.set()
+        release.wait(timeout=5)
+        return graph_store.empty_graph(), version
+
+    monkeypatch.setattr(graph_store, "_fetch_latest", fetch_latest)
+
+    results = []
+    prefetch = threading.Thread(target=lambda: results.append(graph_store.fetch_knowledge_graph("g")))
+    prefetch.start()
+    started.wait(timeout=5)
+
+    written = graph_store.store_knowledge_graph(graph_store.empty_graph(), "g")
+    release.set()
+    _, version = graph_store.fetch_knowledge_graph("g")
+    prefetch.join()
+
+    assert results[0][1] < written
+    assert version == written
+
+
+def graph(*entity_ids: str, relationships=()) -> dict:
+    return {
+        "entities": {entity_id: {"entity_id": entity_id, "entity_names": [entity_id]} for entity_id in entity_ids},
+        "relationships": [
+            {"source_entity_id": source, "target_entity_id": target, "relationship": "knows"}
+            for source, target in relationships
+        ],
+    }
+
+
+def test_make_ref_is_compact():
+    assert graph_store.make_ref(3, {"b", "a"}) == {"graph_version": 3, "entity_ids": ["a", "b"]}
+
+
+def test_resolve_ref_uses_the_referenced_version_when_cached(monkeypatch):
+    monkeypatch.setattr(graph_store, "_cache", OrderedDict())
+    monkeypatch.setattr(graph_store, "_latest", {})
+
+    def fetch_latest(graph_id, stage):
+        raise AssertionError("The cached version should have been used.")
+
+    monkeypatch.setattr(graph_store, "_fetch_latest", fetch_latest)
+    graph_store._cache_put("g", 1, graph("a", "b", "c", relationships=[("a", "b"), ("b", "c")]))
+
+    subgraph = graph_store.resolve_ref("g", graph_store.make_ref(1, ["a", "b"]))
+
+    assert set(subgraph["entities"]) == {"a", "b"}
+    assert subgraph["relationships"] == graph(relationships=[("a", "b")])["relationships"]
+
+
+def test_resolve_ref_falls_back_to_the_latest_version_when_evicted(monkeypatch):
+    monkeypatch.setattr(graph_store, "_cache", OrderedDict())
+    monkeypatch.setattr(graph_store, "_latest", {})
+    monkeypatch.setattr(graph_store, "_fetch_latest", lambda graph_id, stage: (graph("a", "b", "d"), 2))
+
+    subgraph = graph_store.resolve_ref("g", graph_store.make_ref(1, ["a", "b", "c"]))
+
+    assert set(subgraph["entities"]) == {"a", "b"}
+
+
+def test_resolve_ref_of_nothing_is_empty():
+    assert graph_store.resolve_ref("g", None) == graph_store.empty_graph()
@@ -0,0 +1,73 @@
+import pytest
+
+from kaybee_agent import metrics
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Keeps the metrics created by a test out of the process's registry."""
+    monkeypatch.setattr(metrics, "_REGISTRY", [])
+
+
+def test_histogram_renders_cumulative_buckets(registry):
+    histogram = metrics.Histogram("test_seconds", "Test durations.", labelnames=("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, stage="fetch")
+
+    assert histogram.render().splitlines() == [
+        "# HELP test_seconds Test durations.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="fetch",le="0.1"} 1',
+        'test_seconds_bucket{stage="fetch",le="1.0"} 3',
+        'test_seconds_bucket{stage="fetch",le="+Inf"} 4',
+        'test_seconds_sum{stage="fetch"} 4.25',
+        'test_seconds_count{stage="fetch"} 4',
+    ]
+
+
+def test_counter_counts_per_label_set(registry):
+    counter = metrics.Counter("test_total", "Test events.", labelnames=("outcome",))
+    counter.inc(outcome="ok")
+    counter.inc(2, outcome="ok")
+    counter.inc(outcome="error")
+
+    assert (counter.value(outcome="ok"), counter.value(outcome="error")) == (3, 1)
+    assert metrics.render().splitlines()[2:] == ['test_total{outcome="ok"} 3', 'test_total{outcome="error"} 1']
+
+
+def test_nothing_is_recorded_when_disabled(registry, monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    counter = metrics.Counter("test_total", "Test events.")
+    histogram = metrics.Histogram("test_seconds", "Test durations.")
+    counter.inc()
+    histogram.observe(1.0)
+    with histogram.time():
+        pass
+
+    assert counter.value() == 0
+    assert metrics.render().splitlines() == [
+        "# HELP test_total Test events.",
+        "# TYPE test_total counter",
+        "# HELP test_seconds Test durations.",
+        "# TYPE test_seconds histogram",
+    ]
+
+
+def test_metric_types_must_render_their_samples(registry):
+    with pytest.raises(TypeError):
+        metrics._Metric("test", "An incomplete metric.")
+
+
+def test_server_exposes_metrics_in_the_prometheus_text_format(monkeypatch):
+    monkeypatch.setenv("KAYBEE_FAST_START", "true")
+    monkeypatch.setenv("KAYBEE_FEEDBACK_SINK", "local")
+    # The server installs a tracer provider that exports to Cloud Trace.
+    monkeypatch.setenv("OTEL_SDK_DISABLED", "true")
+    import server
+    from fastapi.testclient import TestClient
+
+    response = TestClient(server.app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE kaybee_stage_duration_seconds histogram" in response.text
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models import LlmRequest
+from google.genai import types
+from pydantic import ValidationError
+
+from kaybee_agent import routing
+from kaybee_agent.routing import RoutingRule
+
+
+def test_bounds_are_inclusive():
+    rule = RoutingRule(when={"min_facts": 2, "max_facts": 5})
+    assert [rule.matches({"facts": facts}) for facts in (1, 2, 5, 6)] == [False, True, True, False]
+
+
+def test_missing_features_never_match():
+    assert not RoutingRule(when={"max_facts": 5}).matches({"snippet_chars": 10})
+    assert RoutingRule().matches({})
+
+
+def test_load_policy_reads_the_environment(monkeypatch):
+    monkeypatch.setenv("KAYBEE_ROUTING_POLICY", '{"agent": [{"when": {"max_snippet_chars": 10}, "thinking_budget": 0}]}')
+    assert routing.load_policy() == {"agent": [RoutingRule(when={"max_snippet_chars": 10}, thinking_budget=0)]}
+
+
+def test_load_policy_reads_a_file(monkeypatch, tmp_path):
+    path = tmp_path / "policy.json"
+    path.write_text('{"agent": [{"model": "gemini-2.5-pro"}]}')
+    monkeypatch.delenv("KAYBEE_ROUTING_POLICY", raising=False)
+    monkeypatch.setenv("KAYBEE_ROUTING_POLICY_FILE", str(path))
+    assert routing.load_policy() == {"agent": [RoutingRule(model="gemini-2.5-pro")]}
+
+
+@pytest.mark.parametrize("policy", [
+    '{"agent": [{"when": {"facts": 3}}]}',
+    '{"agent": [{"thinking_budget": "lots"}]}',
+    '{"agent": {"when": {}}}',
+])
+def test_load_policy_rejects_invalid_policies(monkeypatch, policy):
+    monkeypatch.setenv("KAYBEE_ROUTING_POLICY", policy)
+    with pytest.raises(ValidationError):
+        routing.load_policy()
+
+
+def callback_context(agent_name: str, text: str) -> SimpleNamespace:
+    return SimpleNamespace(
+        agent_name=agent_name,
+        user_content=types.Content(role="user", parts=[types.Part(text=text)]),
+        state={},
+    )
+
+
+def test_route_model_call_replaces_the_planners_thinking_config(monkeypatch):
+    monkeypatch.setattr(routing, "POLICY", routing.RoutingPolicy.validate_python({
+        "agent": [{"when": {"max_snippet_chars": 10}, "thinking_budget": 256, "model": "gemini-2.5-flash-lite"}],
+    }))
+    planner_config = types.ThinkingConfig(include_thoughts=True, thinking_budget=1024)
+    llm_request = LlmRequest(model="gemini-2.5-flash", config=types.GenerateContentConfig(thinking_config=planner_config))
+
+    assert routing.route_model_call(callback_context("agent", "Hi"), llm_request) is None
+
+    assert llm_request.config.thinking_config == types.ThinkingConfig(include_thoughts=True, thinking_budget=256)
+    assert llm_request.model == "gemini-2.5-flash-lite"
+    assert planner_config.thinking_budget == 1024
+
+
+def test_route_model_call_keeps_the_planners_settings_when_no_rule_matches(monkeypatch):
+    monkeypatch.setattr(routing, "POLICY", routing.RoutingPolicy.validate_python({
+        "agent": [{"when": {"max_snippet_chars": 1}, "thinking_budget": 0}],
+    }))
+    planner_config = types.ThinkingConfig(thinking_budget=1024)
+    llm_request = LlmRequest(config=types.GenerateContentConfig(thinking_config=planner_config))
+
+    routing.route_model_call(callback_context("agent", "A longer message"), llm_request)
+
+    assert llm_request.config.thinking_config is planner_config
+
+
+def test_measures_merge_features_from_state():
+    context = callback_context("merge_knowledge_agent", "Sam left.")
+    context.state.update({
+        "knowledge_updates": {"knowledge": ["Sam left the team.", "Sam joined Orion."]},
+        "existing_knowledge_ref": {"graph_version": 3, "entity_ids": ["a", "b", "c"]},
+    })
+    assert routing.measure(context) == {"snippet_chars": 9, "facts": 2, "neighborhood_entities": 3}
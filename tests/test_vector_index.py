@@ -0,0 +1,55 @@
+from kaybee_agent import vector_index
+
+
+def entity(entity_id: str, name: str) -> dict:
+    return {"entity_id": entity_id, "entity_names": [name], "properties": {}}
+
+
+def relationship(source: str, target: str, description: str) -> dict:
+    return {"source_entity_id": source, "target_entity_id": target, "relationship": description}
+
+
+def search(index: vector_index.EntityVectorIndex, query: str) -> dict[str, float]:
+    [matches] = index.search([query], k=10, min_score=-1.0)
+    return dict(matches)
+
+
+def assert_matches_fresh_build(index: vector_index.EntityVectorIndex, g: dict, version: int, query: str):
+    fresh = vector_index.EntityVectorIndex()
+    fresh.update(g, version)
+    assert search(index, query) == search(fresh, query)
+
+
+def test_update_reembeds_both_ends_of_a_new_relationship():
+    entities = {"a": entity("a", "Alice"), "b": entity("b", "Bob")}
+    index = vector_index.EntityVectorIndex()
+    index.update({"entities": entities, "relationships": []}, 1)
+
+    g = {"entities": entities, "relationships": [relationship("b", "a", "leads the billing revamp with")]}
+    index.update(g, 2)
+
+    assert search(index, "billing revamp")["a"] > 0.3
+    assert_matches_fresh_build(index, g, 2, "billing revamp")
+
+
+def test_update_reembeds_neighbours_of_a_renamed_entity():
+    relationships = [relationship("a", "b", "works with")]
+    index = vector_index.EntityVectorIndex()
+    index.update({"entities": {"a": entity("a", "Alice"), "b": entity("b", "Bob")}, "relationships": relationships}, 1)
+
+    g = {"entities": {"a": entity("a", "Alice"), "b": entity("b", "Roberta")}, "relationships": relationships}
+    index.update(g, 2)
+
+    assert_matches_fresh_build(index, g, 2, "works with Roberta")
+
+
+def test_cached_indexes_are_bounded_in_bytes(monkeypatch):
+    monkeypatch.setattr(vector_index, "_indexes", type(vector_index._indexes)())
+    g = {"entities": {"a": entity("a", "Alice")}, "relationships": []}
+    one_index = vector_index.get_vector_index("first", g, 1).matrix.nbytes
+    monkeypatch.setattr(vector_index, "MAX_BYTES", 2 * one_index)
+
+    for graph_id in ("second", "third"):
+        vector_index.get_vector_index(graph_id, g, 1)
+
+    assert list(vector_index._indexes) == ["second", "third"]